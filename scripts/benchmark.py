@@ -0,0 +1,213 @@
+import os
+import gc
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import serialization
+import syntheticData
+import runStats
+import generateGraphs
+import metricCube
+from reservationStore import readReservations
+from cloudbedsClient import CloudbedsClient
+from gatherReservations import getEndPoint, initalCall, fetchPages
+
+# repeatable timings and peak memory of every stage of the pipeline on synthetic data
+# every size is generated from the same seed, so two runs on different code measure the same work
+
+stages = ["generate", "fetch", "parse", "aggregate", "totals", "render"]
+engines = ["vectorized", "loop"]
+
+benchmarkDir = "../data/benchmarks"
+
+
+# runs fn repeat times for the timings, then once more under tracemalloc for the peak memory
+# tracemalloc slows python down, so it never runs during a timed run
+# fn returns how many units of work it did, for the throughput
+def measure(fn, repeat, trackMemory, unit):
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = fn()
+        seconds.append(time.perf_counter() - start)
+    result = {
+        "items": items,
+        "unit": unit,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "runs": seconds,
+        "itemsPerSecond": items / min(seconds) if min(seconds) > 0 else None,
+        "peakMemoryMB": None,
+    }
+    if trackMemory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        result["peakMemoryMB"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result
+
+
+# the mock server runs in its own process so its work does not count against the fetch stage
+def startMockServer(roomNights, numProperties, seed, latency):
+    command = [
+        sys.executable, "mockCloudbeds.py",
+        "--room-nights", str(roomNights),
+        "--properties", str(numProperties),
+        "--seed", str(seed),
+        "--latency", str(latency),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    line = process.stdout.readline()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError(f"mock server did not start: {line}")
+    return process, line.strip().removeprefix("listening on ")
+
+
+def fetchAll(url, properties, workers):
+    # the mock server is not rate limited, so neither is the client
+    client = CloudbedsClient("benchmark", workers, baseUrl=url, rateLimit=1e9, burst=1e9)
+    count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pagePool:
+        for propertyID in properties:
+            baseParams = {"propertyID": propertyID}
+            loops = initalCall(client, getEndPoint(), baseParams)
+            for _, data in fetchPages(client, getEndPoint(), baseParams, 1, loops, pagePool):
+                count += len(data)
+    return count
+
+
+def parseAll(paths):
+    count = 0
+    for path in paths.values():
+        for _ in readReservations(path):
+            count += 1
+    return count
+
+
+def aggregateAll(paths, engine):
+    statsByProperty = {}
+    for propertyID, path in paths.items():
+        stats = runStats.fillMonthStructure()
+        runStats.aggregateShard(stats, propertyID, engine, "dataset", path)
+        statsByProperty[propertyID] = stats
+    return statsByProperty
+
+
+# benchmark every stage at one size, returns {stage: measurement}
+def runSize(roomNights, numProperties, selectedStages, selectedEngines, repeat, trackMemory, seed, workers, latency, dataDir):
+    results = {}
+    sizeDir = f"{dataDir}/{roomNights}"
+    paths = {}
+    # the room-nights actually generated, roomNights is only the target the dataset is sized for
+    generated = 0
+
+    def generate():
+        nonlocal generated
+        datasetPaths, generated = syntheticData.writeDataset(sizeDir, roomNights, numProperties, seed)
+        paths.update(datasetPaths)
+        return generated
+
+    # the later stages need the dataset whether or not generate is being measured
+    if "generate" in selectedStages:
+        results["generate"] = measure(generate, repeat, trackMemory, "room-nights")
+    else:
+        generate()
+
+    if "fetch" in selectedStages:
+        process, url = startMockServer(roomNights, numProperties, seed, latency)
+        try:
+            results["fetch"] = measure(lambda: fetchAll(url, list(paths), workers), repeat, trackMemory, "reservations")
+        finally:
+            process.kill()
+            process.wait()
+
+    if "parse" in selectedStages:
+        results["parse"] = measure(lambda: parseAll(paths), repeat, trackMemory, "reservations")
+
+    statsByProperty = None
+    for engine in selectedEngines:
+        if "aggregate" in selectedStages:
+            def aggregate():
+                nonlocal statsByProperty
+                statsByProperty = aggregateAll(paths, engine)
+                return generated
+            results[f"aggregate-{engine}"] = measure(aggregate, repeat, trackMemory, "room-nights")
+
+    if "totals" in selectedStages:
+        if statsByProperty is None:
+            statsByProperty = aggregateAll(paths, selectedEngines[0])
+
+        def totals():
+            for propertyID, stats in statsByProperty.items():
+                runStats.calculateTotalStats(stats, propertyID)
+            return len(statsByProperty)
+        results["totals"] = measure(totals, repeat, trackMemory, "properties")
+
+    if "render" in selectedStages:
+        today = datetime.now().date()
+        monthlyStats = syntheticData.generateMonthlyStats([today.year - 1, today.year], seed)
+        outputPath = f"{sizeDir}/stats.html"
+
+        def render():
+            cube = metricCube.fromMonthlyStats(monthlyStats)
+            generateGraphs.buildGraph(cube, "all").write_html(outputPath)
+            return 1
+        results["render"] = measure(render, repeat, trackMemory, "figures")
+
+    return results
+
+
+def printResults(roomNights, results):
+    print(f"\n{roomNights} room-nights requested")
+    print(f"{'stage':<22}{'best s':>10}{'median s':>10}{'per second':>14}  {'unit':<14}{'peak MB':>10}")
+    for stage, result in results.items():
+        itemsPerSecond = f"{result['itemsPerSecond']:,.0f}" if result["itemsPerSecond"] else "-"
+        peak = f"{result['peakMemoryMB']:.1f}" if result["peakMemoryMB"] is not None else "-"
+        print(f"{stage:<22}{result['best']:>10.3f}{result['median']:>10.3f}{itemsPerSecond:>14}  {result['unit']:<14}{peak:>10}")
+
+
+if(__name__ == "__main__"):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic reservations")
+    parser.add_argument("--room-nights", type=int, nargs="+", default=[10000, 100000], help="dataset sizes to benchmark, 10000 to 10000000")
+    parser.add_argument("--properties", type=int, default=3, help="number of synthetic properties the room-nights are spread over")
+    parser.add_argument("--stages", nargs="+", choices=stages, default=stages)
+    parser.add_argument("--engines", nargs="+", choices=engines, default=engines, help="aggregation engines to time")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best and the median are reported")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra run that measures peak memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="pages fetched at the same time from the mock server")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the mock server waits before every response")
+    parser.add_argument("--data-dir", help="keep the generated datasets here instead of a temporary directory")
+    parser.add_argument("--output", help="where the results are written, defaults to data/benchmarks/<time>.json")
+    args = parser.parse_args()
+
+    outputPath = args.output or f"{benchmarkDir}/{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    report = {
+        "startedAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "properties": args.properties,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tempDir:
+        dataDir = args.data_dir or tempDir
+        for roomNights in args.room_nights:
+            results = runSize(roomNights, args.properties, args.stages, args.engines, args.repeat, not args.no_memory, args.seed, args.workers, args.latency, dataDir)
+            printResults(roomNights, results)
+            report["sizes"][str(roomNights)] = results
+
+    os.makedirs(os.path.dirname(os.path.abspath(outputPath)), exist_ok=True)
+    serialization.dump(report, outputPath, pretty=True)
+    print(f"\nresults written to {outputPath}")
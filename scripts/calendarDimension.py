@@ -0,0 +1,162 @@
+from datetime import date
+
+import numpy as np
+
+import config
+
+# a calendar dimension: one row per day, built once per process and only grown when a day outside of it is asked for
+# every day carries its day, week (iso), month and year keys, so no date is formatted while counting nights,
+# and the units every property had available that day, so capacity follows the inventory as it changes
+# days are date ordinals (date.toordinal), the same numbers reservationModel uses
+
+# whole years from the first one syncs download (resultsFrom in gatherReservations) to a few years ahead,
+# every worker process builds its own copy so it is kept to the years the data has
+calendarStart = date(2020, 1, 1)
+yearsAhead = 2
+
+granularities = ["daily", "weekly", "monthly", "yearly"]
+
+
+class Calendar:
+    def __init__(self, startDate, endDate):
+        self.firstDay = startDate.toordinal()
+        self.lastDay = endDate.toordinal()
+        days = np.arange(np.datetime64(startDate, "D"), np.datetime64(endDate, "D"))
+
+        # iso weeks belong to the year of their thursday, monday is 0 here
+        weekdays = (days.astype(np.int64) + 3) % 7
+        thursdays = days - weekdays + 3
+        isoYears = thursdays.astype("datetime64[Y]")
+        isoWeeks = (thursdays - isoYears.astype("datetime64[D]")).astype(np.int64) // 7 + 1
+        weekKeys = np.char.add(np.char.add(isoYears.astype(str), "-W"), np.char.zfill(isoWeeks.astype(str), 2))
+
+        self.keys = {
+            "daily": days.astype(str).tolist(),
+            "weekly": weekKeys.tolist(),
+            "monthly": days.astype("datetime64[M]").astype(str).tolist(),
+            "yearly": days.astype("datetime64[Y]").astype(str).tolist(),
+        }
+        # the dayKeys and monthKeys lists are what the night loop indexes into
+        self.dayKeys = self.keys["daily"]
+        self.monthKeys = self.keys["monthly"]
+
+        # {key: (first day, day after the last day)} of every period, in order
+        # a period is a run of days with the same key, so its bounds are where the key changes
+        self.periodsByKey = {}
+        for granularity, keys in self.keys.items():
+            keyArray = np.array(keys)
+            starts = np.flatnonzero(np.concatenate(([True], keyArray[1:] != keyArray[:-1])))
+            ends = np.append(starts[1:], len(keys))
+            self.periodsByKey[granularity] = {
+                keys[start]: (self.firstDay + int(start), self.firstDay + int(end))
+                for start, end in zip(starts, ends)
+            }
+
+        # {propertyID: running total of its units}, see cumulativeUnits
+        self.unitTotals = {}
+
+    def dayKey(self, day):
+        return self.dayKeys[day - self.firstDay]
+
+    def monthKey(self, day):
+        return self.monthKeys[day - self.firstDay]
+
+    # (first day, day after the last day) of a period key such as "2025-03" or "2025-W09"
+    def periodBounds(self, key, granularity="monthly"):
+        return self.periodsByKey[granularity][key]
+
+    def daysIn(self, key, granularity="monthly"):
+        first, end = self.periodBounds(key, granularity)
+        return end - first
+
+    # the periods of [firstDay, endDay) as (key, first day, day after the last day), clipped to the range
+    def periods(self, firstDay, endDay, granularity="monthly"):
+        if granularity not in granularities:
+            raise ValueError(f"granularity must be one of {granularities}")
+        self.checkRange(firstDay, endDay)
+        keys = self.keys[granularity]
+        periods = []
+        current = firstDay
+        while current < endDay:
+            key = keys[current - self.firstDay]
+            periodEnd = min(self.periodsByKey[granularity][key][1], endDay)
+            periods.append((key, current, periodEnd))
+            current = periodEnd
+        return periods
+
+    def checkRange(self, firstDay, endDay):
+        if not self.covers(firstDay, endDay):
+            raise ValueError(f"the calendar only covers {date.fromordinal(self.firstDay)} to {date.fromordinal(self.lastDay)}")
+
+    def covers(self, firstDay, endDay):
+        return self.firstDay <= firstDay and endDay <= self.lastDay
+
+
+currentCalendar = None
+
+
+# the calendar, covering at least [firstDay, endDay) when they are given
+# a range it does not cover yet builds a bigger one, in whole years, which is kept from then on
+def getCalendar(firstDay=None, endDay=None):
+    global currentCalendar
+    calendar = currentCalendar
+    if calendar is None:
+        startYear, endYear = calendarStart.year, date.today().year + yearsAhead + 1
+    elif calendar.covers(calendar.firstDay if firstDay is None else firstDay, calendar.lastDay if endDay is None else endDay):
+        return calendar
+    else:
+        startYear, endYear = date.fromordinal(calendar.firstDay).year, date.fromordinal(calendar.lastDay).year
+    if firstDay is not None:
+        startYear = min(startYear, date.fromordinal(firstDay).year)
+    if endDay is not None:
+        endYear = max(endYear, date.fromordinal(endDay - 1).year + 1)
+    calendar = Calendar(date(startYear, 1, 1), date(endYear, 1, 1))
+    currentCalendar = calendar
+    return calendar
+
+
+# units available on every day of the calendar, with the unit changes and blocks of config applied
+# cached per property on the calendar as a running total so the units of any range is two lookups
+def cumulativeUnits(propertyID, calendar):
+    totals = calendar.unitTotals.get(propertyID)
+    if totals is None:
+        totals = unitTotals(propertyID, calendar)
+        calendar.unitTotals[propertyID] = totals
+    return totals
+
+
+def unitTotals(propertyID, calendar):
+    units = np.full(calendar.lastDay - calendar.firstDay, config.defaultUnits, dtype=np.int64)
+    for firstDay, count in sorted(config.unitChanges.get(propertyID, [])):
+        units[dayOffset(calendar, firstDay):] = count
+    for firstDay, endDay, blocked in config.blockedUnits.get(propertyID, []):
+        units[dayOffset(calendar, firstDay):dayOffset(calendar, endDay)] -= blocked
+    if (units < 0).any():
+        raise ValueError(f"{propertyID}: more units blocked than there are")
+    return np.concatenate(([0], np.cumsum(units)))
+
+
+def dayOffset(calendar, isoDate):
+    return min(max(date.fromisoformat(isoDate).toordinal() - calendar.firstDay, 0), calendar.lastDay - calendar.firstDay)
+
+
+# unit nights a property could have sold in [firstDay, endDay)
+def possibleNightsBetween(propertyID, firstDay, endDay):
+    calendar = getCalendar(firstDay, endDay)
+    totals = cumulativeUnits(propertyID, calendar)
+    return int(totals[endDay - calendar.firstDay] - totals[firstDay - calendar.firstDay])
+
+
+# possible nights of a period key, "YYYY-MM" by default
+# every key starts with its year, the calendar is grown to the years around it so an iso week is never cut short
+def possibleNights(propertyID, key, granularity="monthly"):
+    year = int(key[:4])
+    calendar = getCalendar(date(year - 1, 1, 1).toordinal(), date(year + 2, 1, 1).toordinal())
+    return possibleNightsBetween(propertyID, *calendar.periodBounds(key, granularity))
+
+
+# units a property has on a day, a date or a date ordinal
+def unitsOn(propertyID, day):
+    if isinstance(day, date):
+        day = day.toordinal()
+    return possibleNightsBetween(propertyID, day, day + 1)
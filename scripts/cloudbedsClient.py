@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# the base url can be pointed at a local stand-in server for testing
+BASE_URL = os.environ.get("CLOUDBEDS_BASE_URL", "https://api.cloudbeds.com/api/v1.3/")
+
+# requests per second the whole process is allowed to make, and how many can go out in a burst
+RATE_LIMIT = float(os.environ.get("CLOUDBEDS_RATE_LIMIT", 5))
+RATE_BURST = int(os.environ.get("CLOUDBEDS_RATE_BURST", 10))
+
+# (connect, read) timeout in seconds for a single request
+TIMEOUT = (5, 60)
+
+# how many times a request is retried and the bounds of the backoff between tries
+MAX_RETRIES = 6
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+# responses worth trying again, anything else is our fault and retrying will not help
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+# raised when cloudbeds refuses a request or keeps failing after every retry
+class CloudbedsError(Exception):
+    pass
+
+
+# classic token bucket, every request takes a token and tokens refill at a steady rate
+# shared by every thread so the whole process stays under the limit
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # set when the server tells us to back off, nobody gets a token before then
+        self.pausedUntil = 0
+        self.lock = threading.Lock()
+
+    # blocks until a token is available
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.pausedUntil and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.pausedUntil - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    # stop handing out tokens for a while, used when we get throttled
+    def pause(self, seconds):
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+# one client is shared by every fetch so they all go through the same connection pool and rate limiter
+class CloudbedsClient:
+    def __init__(self, apiKey, maxWorkers, baseUrl=BASE_URL, rateLimit=RATE_LIMIT, burst=RATE_BURST):
+        self.baseUrl = baseUrl
+        self.bucket = TokenBucket(rateLimit, burst)
+
+        # the pool is sized so every worker can keep its own connection open
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {apiKey}",
+            "accept": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=maxWorkers, pool_maxsize=maxWorkers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # GET an endpoint and return the decoded body
+    # throttling, timeouts and server errors are retried with exponential backoff
+    def get(self, endPoint, params):
+        url = f"{self.baseUrl}{endPoint}"
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt > 0:
+                metrics.count("retries")
+            with metrics.span("rateLimitWait"):
+                self.bucket.acquire()
+            try:
+                with metrics.span("http"):
+                    response = self.session.get(url=url, params=params, timeout=TIMEOUT)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                metrics.count("httpErrors")
+                if attempt == MAX_RETRIES:
+                    raise CloudbedsError(f"{endPoint} failed after {attempt + 1} tries: {e}") from e
+                self.wait(attempt, None)
+                continue
+
+            metrics.count("httpRequests")
+            metrics.count("bytesDownloaded", len(response.content))
+            if response.status_code in RETRY_STATUS:
+                metrics.count(f"http{response.status_code}")
+                if attempt == MAX_RETRIES:
+                    raise CloudbedsError(f"{endPoint} failed after {attempt + 1} tries: HTTP {response.status_code}")
+                retryAfter = parseRetryAfter(response.headers.get("Retry-After"))
+                # a 429 means everyone is going too fast, not just this request
+                if response.status_code == 429:
+                    self.bucket.pause(retryAfter or backoffDelay(attempt))
+                self.wait(attempt, retryAfter)
+                continue
+
+            if response.status_code >= 400:
+                raise CloudbedsError(f"{endPoint} returned HTTP {response.status_code}: {response.text[:200]}")
+
+            try:
+                with metrics.span("decode"):
+                    resJSON = response.json()
+            except ValueError as e:
+                # a proxy or maintenance page can come back as a 200 with html in it, it is retried like a 5xx
+                metrics.count("invalidResponses")
+                if attempt == MAX_RETRIES:
+                    raise CloudbedsError(f"{endPoint} failed after {attempt + 1} tries: the response was not json: {response.text[:200]}") from e
+                self.wait(attempt, parseRetryAfter(response.headers.get("Retry-After")))
+                continue
+            if resJSON.get("success") != True:
+                raise CloudbedsError(f"{endPoint} was not successful: {resJSON.get('message')}")
+            return resJSON
+
+    def wait(self, attempt, retryAfter):
+        delay = backoffDelay(attempt)
+        # never come back earlier than the server asked us to
+        if retryAfter is not None:
+            delay = max(delay, retryAfter)
+        time.sleep(delay)
+
+
+# exponential backoff with full jitter so retrying workers do not all come back at the same moment
+def backoffDelay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Retry-After is either a number of seconds or an http date
+# returns the number of seconds to wait or None if there was no usable header
+def parseRetryAfter(value):
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        retryAt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retryAt.tzinfo is None:
+        retryAt = retryAt.replace(tzinfo=timezone.utc)
+    return max(0, (retryAt - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,55 @@
+# shared settings used by every script
+
+# every property (building) we pull from cloudbeds
+# add new buildings here and they will be picked up by the next sync
+propertyIDs =[
+    "214969",
+    "295812",
+    "215018",
+    "317876",
+    "318157"
+]
+
+# where the per-property reservation datasets are written
+# each dataset is line delimited json, one reservation per line
+reservationsDir = "../data/reservations"
+
+
+# path of the reservation dataset for a single property
+def reservationsPath(propertyID):
+    return f"{reservationsDir}/{propertyID}.jsonl"
+
+
+# the fields of a reservation that are kept in the working datasets, everything else is dropped at fetch time
+# True keeps a field as it is, a dict keeps only those fields of it (for a list, of every item in it)
+# set to None to keep the whole api payload
+reservationSchema = {
+    "reservationID": True,
+    "propertyID": True,
+    "status": True,
+    "dateCreated": True,
+    "dateModified": True,
+    "rooms": {
+        "roomID": True,
+        "roomTypeID": True,
+        "roomStatus": True,
+        "roomCheckIn": True,
+        "roomCheckOut": True,
+        "detailedRoomRates": True,
+    },
+}
+
+# where the untouched api pages are archived (gzip compressed) when archiving is turned on
+rawArchiveDir = "../data/raw"
+
+# units available to rent at every property, used for occupancy, RevPAR and possible revenue
+# a property not listed has defaultUnits for its whole history
+defaultUnits = 48
+# units added or removed for good, as (first day, units from that day on) in date order
+# e.g. "214969": [("2020-01-01", 48), ("2026-03-01", 52)]
+unitChanges = {
+}
+# units taken out of inventory for a while (renovations, owner stays), as (first day, day after the last day, units blocked)
+# e.g. "214969": [("2025-02-01", "2025-02-15", 3)]
+blockedUnits = {
+}
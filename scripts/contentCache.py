@@ -0,0 +1,139 @@
+import os
+import shutil
+import hashlib
+import time
+
+import serialization
+
+# content addressed cache for work that only depends on its inputs, like monthlyStats and rendered reports
+# a key is the sha256 of everything the result depends on: input file contents, the source of the code
+# that produced it and its parameters, so a changed input or a code change is simply a different key
+# entries are evicted once they are older than maxAge or the cache grows past maxBytes, least recently used first
+
+cacheDir = "../data/cache"
+MAX_BYTES = int(os.environ.get("CLOUDBEDS_CACHE_MAX_MB", 500)) * 1024 * 1024
+MAX_AGE = float(os.environ.get("CLOUDBEDS_CACHE_MAX_DAYS", 30)) * 24 * 60 * 60
+
+readChunkSize = 1024 * 1024
+
+# (path, size, mtime) -> sha256, files are only hashed again when they change
+fileDigests = {}
+
+
+def fileDigest(path):
+    if not os.path.exists(path):
+        return None
+    info = os.stat(path)
+    memoKey = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+    if memoKey not in fileDigests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(readChunkSize), b""):
+                digest.update(chunk)
+        fileDigests[memoKey] = digest.hexdigest()
+    return fileDigests[memoKey]
+
+
+# hash of the source of the modules a result is computed by, editing any of them invalidates their entries
+# modules are passed in rather than looked up by name, a script run directly is __main__ and not its own name
+def codeVersion(modules):
+    return makeKey(sorted(fileDigest(module.__file__) for module in modules))
+
+
+# parts can be anything serialization can write, dates go in as iso strings
+def makeKey(parts):
+    return hashlib.sha256(serialization.dumps(parts)).hexdigest()
+
+
+def entryPath(kind, key):
+    return f"{cacheDir}/{kind}/{key[:2]}/{key}"
+
+
+# path of a cached entry or None, a hit counts as a use for the eviction order
+def lookup(kind, key):
+    path = entryPath(kind, key)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return path
+
+
+# json-like values, stored as compressed snapshots
+def load(kind, key):
+    path = lookup(kind, key)
+    if path is None:
+        return None
+    return serialization.load(path)
+
+
+def store(kind, key, value):
+    path = entryPath(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    serialization.dump(value, path, "snapshot")
+    evict()
+
+
+# files, copied in and out of the cache whole
+# copies a cached file to outputPath, returns False when there is none
+def copyOut(kind, key, outputPath):
+    path = lookup(kind, key)
+    if path is None:
+        return False
+    shutil.copyfile(path, outputPath)
+    return True
+
+
+def storeFile(kind, key, sourcePath):
+    path = entryPath(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # copied under a temporary name so a reader never sees half an entry
+    tempPath = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(sourcePath, tempPath)
+    os.replace(tempPath, path)
+    evict()
+
+
+# drop entries past maxAge, then the least recently used until the cache fits in maxBytes
+def evict(maxBytes=MAX_BYTES, maxAge=MAX_AGE):
+    now = time.time()
+    entries = []
+    for root, _, files in os.walk(cacheDir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                # another process evicted it first
+                continue
+            if now - info.st_mtime > maxAge:
+                removeEntry(path)
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+
+    totalBytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if totalBytes <= maxBytes:
+            break
+        removeEntry(path)
+        totalBytes -= size
+
+
+def removeEntry(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evict old entries from the stats and report cache, or clear it")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    parser.add_argument("--max-mb", type=float, default=MAX_BYTES / 1024 / 1024)
+    parser.add_argument("--max-days", type=float, default=MAX_AGE / 24 / 60 / 60)
+    args = parser.parse_args()
+    if args.clear:
+        shutil.rmtree(cacheDir, ignore_errors=True)
+    else:
+        evict(args.max_mb * 1024 * 1024, args.max_days * 24 * 60 * 60)
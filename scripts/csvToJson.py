@@ -1,33 +1,147 @@
-import json
-import csv
-import sys
 import os
-import re
+import glob
+
+import pandas as pd
+
+import serialization
+import metrics
+
+# adds the monthly occupancy of exported csv files to a stats json
+# months the stats already have are kept as they are, the csv only fills in the missing ones
+
+csvColumns = ["Year", "Month", "Occupancy", "NightsOccupied"]
+# exports of several properties at once have this column, the rows then go to each property's own stats file
+propertyColumn = "PropertyID"
 
 
 def main():
     csvPath = "../data/occup_rate_012024-082025.csv"
-    csvSplit = re.split("[.]",csvPath)
     dataJsonPath = "../data/09-16-2025_4_months.json"
 
-    with open(csvPath, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        with open(dataJsonPath, "r", encoding="utf-8", newline="") as f:
-            jsonObject = json.load(f)
-        for row in reader:
-            year = row["Year"]
-            month = row["Month"] if len(row["Month"]) == 2 else "0" + row["Month"]
-            occupancy = row["Occupancy"]
-            nightsOccupied = row["NightsOccupied"]
-            yearMonth = year + "-" + month
-            if yearMonth not in jsonObject:
-                jsonObject[yearMonth] = {
-                    "occupancyPercent" : int(occupancy),
-                    "nightsRented" : int(nightsOccupied)
-                }
-
-    with open(dataJsonPath, "w", encoding="utf-8", newline="") as f:
-        json.dump(jsonObject, f, indent=4)
-            
+    bulkImport([csvPath], dataJsonPath)
+
+
+# import every csv matching the glob patterns in one pass
+# targetPath is the stats file the months are added to, exports with a PropertyID column need a
+# {propertyID} in it (e.g. ../data/history_{propertyID}.json) so every property gets its own file
+# returns {target path: months added}, dryRun only reports what would be added
+def bulkImport(patterns, targetPath, dryRun=False):
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if not paths:
+        raise ValueError(f"no csv files match {' '.join(patterns)}")
+
+    with metrics.span("read"):
+        rows = readExports(paths)
+    metrics.count("rows", len(rows))
+
+    with metrics.span("validate"):
+        rows = validRows(rows)
+        rows = dedupeRows(rows)
+
+    byProperty = rows.groupby(propertyColumn, sort=True) if propertyColumn in rows else [(None, rows)]
+    added = {}
+    for propertyID, propertyRows in byProperty:
+        if propertyID is not None and "{propertyID}" not in targetPath:
+            raise ValueError(f"the exports have a {propertyColumn} column, the target needs a {{propertyID}} in it")
+        path = targetPath.format(propertyID=propertyID) if propertyID is not None else targetPath
+        added[path] = mergeRows(propertyRows, path, dryRun)
+    return added
+
+
+# every export in one frame, the file each row came from is kept so problems can be traced back to it
+# files are read oldest first so when two exports disagree on a month the newest one wins
+def readExports(paths):
+    frames = []
+    for path in sorted(paths, key=os.path.getmtime):
+        frame = pd.read_csv(path, dtype=str, skipinitialspace=True)
+        missing = [column for column in csvColumns if column not in frame]
+        if missing:
+            raise ValueError(f"{path} is missing the columns {', '.join(missing)}")
+        frame = frame[csvColumns + ([propertyColumn] if propertyColumn in frame else [])]
+        frame["source"] = path
+        frames.append(frame)
+    if len({propertyColumn in frame for frame in frames}) > 1:
+        raise ValueError(f"only some of the exports have a {propertyColumn} column, import them separately")
+    return pd.concat(frames, ignore_index=True)
+
+
+# drop the rows that are not a whole month of whole numbers, and say which ones were dropped
+def validRows(rows):
+    numbers = rows[csvColumns].apply(pd.to_numeric, errors="coerce")
+    valid = (
+        numbers.notna().all(axis=1)
+        & (numbers % 1 == 0).all(axis=1)
+        & numbers["Month"].between(1, 12)
+        & numbers["Occupancy"].between(0, 100)
+        & (numbers["NightsOccupied"] >= 0)
+    )
+    for _, row in rows[~valid].head(5).iterrows():
+        print(f"skipping invalid row in {row['source']}: {row[csvColumns].to_dict()}")
+    if (~valid).sum():
+        print(f"{(~valid).sum()} invalid rows skipped")
+    metrics.count("invalidRows", int((~valid).sum()))
+
+    numbers = numbers[valid].astype(int)
+    result = pd.DataFrame({
+        # the same "YYYY-MM" keys the stats use
+        "month": numbers["Year"].astype(str) + "-" + numbers["Month"].astype(str).str.zfill(2),
+        "occupancyPercent": numbers["Occupancy"],
+        "nightsRented": numbers["NightsOccupied"],
+        "source": rows.loc[valid, "source"],
+    })
+    if propertyColumn in rows:
+        result[propertyColumn] = rows.loc[valid, propertyColumn].str.strip()
+    return result
+
+
+# one row per property and month, the same month in several exports is only a conflict when the numbers differ
+def dedupeRows(rows):
+    keys = [propertyColumn, "month"] if propertyColumn in rows else ["month"]
+    duplicated = rows.duplicated(keys + ["occupancyPercent", "nightsRented"])
+    metrics.count("duplicateRows", int(duplicated.sum()))
+    rows = rows[~duplicated]
+
+    conflicting = rows[rows.duplicated(keys, keep=False)]
+    for key, group in conflicting.groupby(keys):
+        print(f"{' '.join(key)}: exports disagree, using {group['source'].iloc[-1]}")
+    return rows.drop_duplicates(keys, keep="last")
+
+
+# add the months the stats file does not have yet and write it once, returns how many were added
+def mergeRows(rows, path, dryRun):
+    with metrics.span("load"):
+        stats = serialization.load(path) if os.path.exists(path) else {}
+
+    newRows = rows[~rows["month"].isin(list(stats))]
+    print(f"{path}: {len(newRows)} months added, {len(rows) - len(newRows)} already in the stats")
+    metrics.count("monthsAdded", len(newRows))
+    if dryRun or newRows.empty:
+        return len(newRows)
+
+    for month, occupancy, nightsRented in zip(newRows["month"], newRows["occupancyPercent"].tolist(), newRows["nightsRented"].tolist()):
+        stats[month] = {
+            "occupancyPercent": occupancy,
+            "nightsRented": nightsRented,
+        }
+
+    # serialization writes to a temporary file and renames it, a failed import never leaves half a stats file
+    with metrics.span("write"):
+        serialization.dump(dict(sorted(stats.items())), path, pretty=True)
+    return len(newRows)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Add the monthly occupancy of exported csv files to the stats json")
+    parser.add_argument("--bulk", nargs="+", metavar="PATTERN", help="import every csv matching these globs, e.g. '../data/history/*.csv'")
+    parser.add_argument("--target", default="../data/09-16-2025_4_months.json", help="stats file to add the months to, use {propertyID} in it for exports with a PropertyID column")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be added")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+    if args.bulk:
+        bulkImport(args.bulk, args.target, args.dry_run)
+    else:
+        main()
+    metrics.finish("csvToJson", args)
@@ -1,93 +1,251 @@
 import os
 import sys
-import json
+import argparse
 import pandas as pd
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from dotenv import load_dotenv
 import math
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+
+import reservationStore
+import projection
+import warehouse
+import statsAggregates
+import paceStore
+import metrics
+from cloudbedsClient import CloudbedsClient
+from config import propertyIDs, reservationsDir, reservationsPath
 
 load_dotenv()
 
 API_KEY = os.environ.get("CLOUDBEDS_API_KEY")
 
-propertyIDs =[
-    "214969",
-    "295812",
-    "215018",
-    "317876",
-    "318157"
-]
-
-def getReservations():
-    # create endpoint
-    baseUrl = "https://api.cloudbeds.com/api/v1.3/"
-    baseEndpoint = "getReservation"
-    additionalEndPoint = "sWithRateDetails"
-    endPoint = baseEndpoint + additionalEndPoint
-    fullEndPoint = f"{baseUrl}{endPoint}"
+# how many pages can be in flight at the same time, across every property
+MAX_WORKERS = int(os.environ.get("CLOUDBEDS_MAX_WORKERS", 8))
+
+# how many pages of a single property can be requested ahead of the one being written
+PAGE_WINDOW = MAX_WORKERS * 2
+
+# how far before the last high water mark an incremental sync starts looking
+SYNC_OVERLAP = timedelta(minutes=10)
+
+
+# this pulls every property at the same time, each property does its own pagination
+# pages from every property share one pool so the concurrency limit holds for the whole run
+# loadWarehouse also loads what was downloaded into the sqlite warehouse
+# updateAggregates keeps the persisted monthly aggregates in step with what changed
+# archiveRaw keeps a compressed copy of the untouched api pages next to the projected dataset
+# recordPace takes today's on the books snapshot of every property once it is synced, see paceStore
+# returns the properties whose dataset changed, every one of them after a full sync
+def syncAllProperties(properties=propertyIDs, maxWorkers=MAX_WORKERS, incremental=False, loadWarehouse=False, updateAggregates=False, archiveRaw=False, recordPace=False):
+    os.makedirs(reservationsDir, exist_ok=True)
 
-    # pass in headers
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "accept": "application/json"
+    # one client is shared by every worker so connections and the rate limit are shared too
+    client = CloudbedsClient(API_KEY, maxWorkers)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pagePool:
+        with ThreadPoolExecutor(max_workers=len(properties)) as propertyPool:
+            futures = [
+                propertyPool.submit(getReservations, propertyID, client, pagePool, incremental, loadWarehouse, updateAggregates, archiveRaw)
+                for propertyID in properties
+            ]
+            # calling result() re-raises anything that went wrong in a property
+            changedProperties = [propertyID for propertyID, future in zip(properties, futures) if future.result()]
+
+    if recordPace:
+        for propertyID in properties:
+            with metrics.span("pace"):
+                changed = paceStore.recordSnapshot(propertyID)
+            print(f"{propertyID}: on the books changed for {changed} months")
+
+    return changedProperties
+
+
+# returns whether the property's dataset changed
+def getReservations(propertyID, client, pagePool, incremental=False, loadWarehouse=False, updateAggregates=False, archiveRaw=False):
+    fullEndPoint = getEndPoint()
+
+    # everything since 2020, unless we only want what changed since the last sync
+    # params are kept as strings so the checkpoint can tell if a resumed sync asked for the same thing
+    baseParams = {
+        "propertyID": propertyID,
+        "resultsFrom" : date(2020,1,1).isoformat()
     }
 
-    outputPath = "../data/reservations.json"
+    # the next mark is the newest dateModified downloaded, see PageWriter.highWaterMark, this only names the sync
+    syncStartTime = datetime.now()
+    highWaterMark = reservationStore.getHighWaterMark(propertyID) if incremental else None
+    if highWaterMark is not None and not os.path.exists(reservationsPath(propertyID)):
+        # a delta needs the dataset it goes on top of, without it the whole history is downloaded again
+        print(f"{propertyID}: has a sync mark but no dataset at {reservationsPath(propertyID)}, doing a full sync")
+        highWaterMark = None
+    if highWaterMark is not None:
+        # go back a little further than the last mark, upserting the same reservation twice is harmless
+        baseParams["modifiedFrom"] = (highWaterMark - SYNC_OVERLAP).strftime(reservationStore.syncStateFormat)
+        mode = "delta"
+        print(f"{propertyID}: fetching reservations modified since {baseParams['modifiedFrom']}")
+    else:
+        mode = "full"
 
-    # clear the json
-    with open (outputPath, "w", encoding="utf-8", newline="") as f:
-        pass
+    # pages are written as they arrive, an interrupted sync resumes after the last page on disk
+    writer = reservationStore.PageWriter(propertyID, mode, baseParams, syncStartTime)
+    if writer.lastPage > 0:
+        print(f"{propertyID}: resuming after page {writer.lastPage}")
 
     # figure out how many calls we need
-    loops = initalCall(fullEndPoint,headers)
+    with metrics.span("initialCall"):
+        loops = initalCall(client, fullEndPoint, baseParams)
+
+    rawPath = projection.rawArchivePath(propertyID, writer.syncStartTime)
 
-    allReservations = []
-    for i in range(0,loops):
+    pages = fetchPages(client, fullEndPoint, baseParams, writer.lastPage + 1, loops, pagePool)
+    for pageNumber, data in pages:
+        print(f"{propertyID}: {pageNumber}/{loops} pages complete")
+        metrics.count("pages")
+        metrics.count("reservations", len(data))
+        with metrics.span("page"):
+            # archived before anything is added, the archive is the page exactly as the api sent it
+            if archiveRaw:
+                with metrics.span("archiveRaw"):
+                    projection.archiveRawPage(rawPath, data)
+            # only the fields the pipeline uses go into the working dataset
+            with metrics.span("projection"):
+                reservations = projection.projectReservations(data)
+            # tag every reservation so merged datasets still know where they came from
+            for reservation in reservations:
+                reservation["propertyID"] = propertyID
+            with metrics.span("writePage"):
+                writer.writePage(pageNumber, reservations)
+
+    syncMark = writer.highWaterMark(highWaterMark)
+    if mode == "full":
+        writer.finish(reservationsPath(propertyID))
+        if loadWarehouse:
+            updateWarehouse(propertyID, reservationsPath(propertyID), replaceAll=True)
+        if updateAggregates:
+            with metrics.span("aggregates"):
+                statsAggregates.rebuildAggregates(propertyID, syncMark)
+        print(f"{propertyID}: {writer.count} reservations downloaded")
+    else:
+        deltaPath = f"{reservationsDir}/{propertyID}.delta.jsonl"
+        writer.finish(deltaPath)
+        # the delta is merged and removed below, so it goes to the warehouse first
+        # a property the warehouse has never seen gets the whole merged dataset instead, after the merge
+        loadMerged = loadWarehouse and not warehouseHasProperty(propertyID)
+        if loadWarehouse and not loadMerged:
+            updateWarehouse(propertyID, deltaPath, replaceAll=False)
+        # the old copy of every changed reservation is subtracted from the aggregates and the new one added
+        # aggregates that are missing or missed a sync (it ran without --aggregates) are rebuilt from the merged dataset
+        aggregates = statsAggregates.loadAggregates(propertyID) if updateAggregates else None
+        applyDelta = updateAggregates and statsAggregates.isCurrent(aggregates, highWaterMark)
+        changes = []
+        onChange = (lambda old, new: changes.append((old, new))) if applyDelta else None
+        with metrics.span("mergeDelta"):
+            inserted, updated = reservationStore.mergeDelta(propertyID, deltaPath, onChange)
+        print(f"{propertyID}: {inserted} new and {updated} updated reservations")
+        if loadMerged:
+            updateWarehouse(propertyID, reservationsPath(propertyID), replaceAll=True)
+        if applyDelta:
+            with metrics.span("aggregates"):
+                affectedMonths = statsAggregates.applyChanges(aggregates, changes, propertyID)
+                aggregates["syncMark"] = syncMark.strftime(reservationStore.syncStateFormat)
+                statsAggregates.saveAggregates(propertyID, aggregates)
+            print(f"{propertyID}: stats updated for {len(affectedMonths)} months")
+        elif updateAggregates:
+            with metrics.span("aggregates"):
+                aggregates = statsAggregates.rebuildAggregates(propertyID, syncMark)
+            print(f"{propertyID}: stats rebuilt for {len(aggregates['partials'])} months")
+
+    reservationStore.setHighWaterMark(propertyID, syncMark)
+    return mode == "full" or inserted + updated > 0
+
+
+# each property thread uses its own connection, sqlite connections cannot be shared between threads
+def updateWarehouse(propertyID, path, replaceAll):
+    conn = warehouse.connect()
+    try:
+        with metrics.span("warehouse"):
+            count = warehouse.loadProperty(conn, propertyID, path, replaceAll=replaceAll)
+    finally:
+        conn.close()
+    print(f"{propertyID}: {count} reservations loaded into the warehouse")
+
+
+def warehouseHasProperty(propertyID):
+    conn = warehouse.connect()
+    try:
+        return warehouse.hasProperty(conn, propertyID)
+    finally:
+        conn.close()
+
+
+# create endpoint
+def getEndPoint():
+    baseEndpoint = "getReservation"
+    additionalEndPoint = "sWithRateDetails"
+    return baseEndpoint + additionalEndPoint
+
+
+# fetch the pages of a property through the shared page pool
+# pages finish in any order but are handed back in page order
+# only a few pages are in flight at once so finished pages never pile up in memory
+def fetchPages(client, fullEndPoint, baseParams, firstPage, lastPage, pagePool):
+    def fetchPage(pageNumber):
         # params to be sent to the call
         params = {
-            "propertyID": propertyIDs[0],
-            "pageNumber": i + 1,
+            **baseParams,
+            "pageNumber": pageNumber,
             "includeAllRooms" : True,
-            "resultsFrom" : date(2020,1,1)
         }
-        data = apiCall(fullEndPoint=fullEndPoint,headers=headers,params=params)
-        print(f"\r{i}/{loops} pages complete        ", end="")
-        allReservations.extend(data)
-    with open (outputPath, "a", encoding="utf-8", newline="") as f:
-            json.dump(allReservations, f, indent = 4)
+        return apiCall(client=client, fullEndPoint=fullEndPoint, params=params)
+
+    inFlight = deque()
+    nextPage = firstPage
+    while nextPage <= lastPage or inFlight:
+        while nextPage <= lastPage and len(inFlight) < PAGE_WINDOW:
+            inFlight.append((nextPage, pagePool.submit(fetchPage, nextPage)))
+            nextPage += 1
+        pageNumber, future = inFlight.popleft()
+        yield (pageNumber, future.result())
 
 
 # this is the intial API call to figure out how many calls we need in total
 # returns (total count, count per page)
-def initalCall(fullEndPoint, headers):
-    # pass in inital parameters
-    initParams = {
-        "propertyID": propertyIDs[0],
-        "resultsFrom" : date(2020,1,1)
-    }
-    # grab response and convert to JSON
-    response = requests.get(url=fullEndPoint, headers=headers, params=initParams)
-    print(response)
-    resJSON = response.json()
+def initalCall(client, fullEndPoint, baseParams):
+    propertyID = baseParams["propertyID"]
+    # grab response as JSON, the client takes care of retries and rate limiting
+    resJSON = client.get(fullEndPoint, baseParams)
     totalCount = resJSON["total"]
     countPerPage = resJSON["count"]
-    print(f"{totalCount} total entries")
-    print(f"{countPerPage} per page")
+    print(f"{propertyID}: {totalCount} total entries")
+    print(f"{propertyID}: {countPerPage} per page")
+    # nothing to fetch, this happens when nothing changed since the last sync
+    if totalCount == 0:
+        return 0
     # take the ceiling to ensure we dont miss any data
     loops = math.ceil(totalCount/countPerPage)
 
     return loops
 
-def apiCall(fullEndPoint,headers, params):
-    response = requests.get(url=fullEndPoint, headers=headers, params=params)
-    resJSON = response.json()
-    if resJSON["success"] != True:
-            print(f"something went wrong")
-            return
+# a page that cannot be fetched raises CloudbedsError instead of silently coming back empty
+def apiCall(client, fullEndPoint, params):
+    resJSON = client.get(fullEndPoint, params)
     data = resJSON["data"]
     return data
 
 if(__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="Download reservations from Cloudbeds")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="maximum number of pages fetched at the same time")
+    parser.add_argument("--property", action="append", dest="properties", help="only sync this property, can be given more than once")
+    parser.add_argument("--incremental", action="store_true", help="only fetch reservations modified since the last sync and upsert them")
+    parser.add_argument("--warehouse", action="store_true", help="also load the downloaded reservations into the sqlite warehouse")
+    parser.add_argument("--aggregates", action="store_true", help="keep the persisted monthly aggregates up to date with the reservations that changed")
+    parser.add_argument("--archive-raw", action="store_true", help="also archive the untouched api pages, gzip compressed, under data/raw")
+    parser.add_argument("--pace", action="store_true", help="also record today's on the books snapshot of every property for booking pace")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
     # testBlockedDates()
-    getReservations()
\ No newline at end of file
+    syncAllProperties(properties=args.properties or propertyIDs, maxWorkers=args.workers, incremental=args.incremental, loadWarehouse=args.warehouse, updateAggregates=args.aggregates, archiveRaw=args.archive_raw, recordPace=args.pace)
+    metrics.finish("gatherReservations", args)
@@ -1,75 +1,138 @@
 
 # general imports
 import os
-import json
+import re
+import sys
+import hashlib
 import webbrowser
-import pandas as pd
+import numpy as np
+
+import serialization
+import metrics
+import metricCube
+import contentCache
+import paceStore
 
 # date imports
-from calendar import month_name
+from calendar import month_abbr
 from datetime import date, datetime
 
 # graph imports
+import plotly
 import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
-years = [2024, 2025]
-year_colors = {
-    years[0]: ("#5F768E", "#B0C4DE"),
-    years[1]: ("#D4610E", "#D2B48C")
-}
+# colors of each year shown as (past months, future months), the years get them in order
+yearPalette = [
+    ("#5F768E", "#B0C4DE"),
+    ("#D4610E", "#D2B48C"),
+    ("#4E7D5B", "#A9C8B0"),
+    ("#7B5EA7", "#C9B8E3"),
+    ("#A33B3B", "#E0A9A9"),
+]
+
+# where the shared plotly.js and layout template are written for reports that link to them instead of embedding them
+sharedAssetsDir = "../data/assets"
+
+# page of a report that links to the shared assets, the figure is drawn from its json
+reportPage = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<script src="{plotlyPath}"></script>
+<script src="{templatePath}"></script>
+</head>
+<body>
+<div id="report"></div>
+<script>
+var figure = {figureJson};
+figure.layout.template = reportTemplate;
+Plotly.newPlot("report", figure.data, figure.layout, {{"responsive": true}});
+</script>
+</body>
+</html>
+"""
+
+# the code a rendered figure depends on, an edit to any of these makes the cached figures stale
+figureModules = [sys.modules[__name__], metricCube, serialization]
+
+ordered_months = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+]
+
+
+# shownYears limits the graphs to some years, by default every year in the stats is shown
+# shared links the html to the shared plotly.js instead of embedding it
+def main(shownYears=None, shared=False, useCache=True):
+    jsonFilePath = "../data/09-16-2025_4_months.json"
+    with metrics.span("load"):
+        cube = metricCube.loadCube({"all": jsonFilePath})
+    createGraph(cube, "all", shownYears, shared, useCache)
+
 
+# {year: (past color, future color)} for the years being shown
+def yearColors(shownYears):
+    return {year: yearPalette[i % len(yearPalette)] for i, year in enumerate(shownYears)}
 
-def main():
-    jsonFilePath = "../data/09-16-2025_4_months.json"
-    with open(jsonFilePath, "r", encoding="utf-8") as f:
-        monthlyStats = json.load(f)
-    createGraph(monthlyStats=monthlyStats)
+
+# the years of a property to show, in order
+def selectYears(cube, propertyID, shownYears=None):
+    available = cube.yearsWithData(propertyID)
+    if shownYears is None:
+        return available
+    return [year for year in sorted(shownYears) if year in available]
 
 
 # this function creates a standard graph that can be distributed to co-owners or others
-def createGraph(monthlyStats):
+def createGraph(cube, propertyID, shownYears=None, shared=False, useCache=True):
     # where to save the HTML
     outputPath = "../data/stats.html"
 
-    # initlize the graphs and convert monthly stats into a format to be worked with
-    fig, df_monthly_stats = initFigure(monthlyStats=monthlyStats)
+    cacheKey = figureCacheKey(cube, propertyID, "simple", shownYears, None, "html", outputPath, shared) if useCache else None
+    writeCached(cacheKey, outputPath, lambda: buildGraph(cube, propertyID, shownYears), lambda fig, path: writeHtml(fig, path, shared), shared)
+    viewHtml(outputPath)
+
+
+# builds the standard graph without saving or opening it
+def buildGraph(cube, propertyID, shownYears=None, title="Werfy Luxury Apart-Hotel"):
+    year_colors = yearColors(selectYears(cube, propertyID, shownYears))
+
+    # initlize the graphs
+    fig = initFigure()
 
     # Add the first chart: Occupancy Percentage
-    add_bar_chart(fig, 2, 1, 'occupancyPercent', 'Occupancy %', year_colors, df_monthly_stats)
+    with metrics.span("charts"):
+        add_bar_chart(fig, 2, 1, 'occupancyPercent', 'Occupancy %', year_colors, cube, propertyID)
 
     # add the table for the occupancy percent
-    add_table(fig,3,1, "occupancyPercent", year_colors, df_monthly_stats)
+    with metrics.span("table"):
+        add_table(fig,3,1, "occupancyPercent", year_colors, cube, propertyID)
 
     # Add the second chart: Number of Reservations
-    add_bar_chart(fig, 4, 1, 'nightsRented', 'Reservation Nights', year_colors, df_monthly_stats)
+    with metrics.span("charts"):
+        add_bar_chart(fig, 4, 1, 'nightsRented', 'Reservation Nights', year_colors, cube, propertyID)
 
     # add annotations to the figure. Annotations are the legends, descriptions, and include the title too
-    addAnnotations(fig)
+    addAnnotations(fig, year_colors)
 
     # update layout information
-    updateLayout(fig)
+    updateLayout(fig, list(year_colors), title)
 
-    saveAndViewFig(fig,outputPath=outputPath)
+    return fig
 
 
-    # this function creates a more comprehensive graph
-    # this should be used only for internal use
+# this function creates a more comprehensive graph to be viewed internally.
+def createComprehensiveGraph(cube, propertyID, shownYears=None):
+    fig = buildComprehensiveGraph(cube, propertyID, shownYears)
+    fig.show()
 
 
-# this function creates a more comprehensive graph to be viewed internally.
-# note this function is not as organized as createGraph is
-def createComprehensiveGraph(monthlyStats):
-    # Convert the dictionary to a Pandas DataFrame
-    df_monthly_stats = pd.DataFrame.from_dict(monthlyStats, orient='index')
-    df_monthly_stats.index.name = 'Month'
-    df_monthly_stats.reset_index(inplace=True)
-
-    # Parse month to datetime and extract year, month name
-    df_monthly_stats['Month'] = pd.to_datetime(df_monthly_stats['Month'])
-    df_monthly_stats['Year'] = df_monthly_stats['Month'].dt.year
-    df_monthly_stats['MonthName'] = df_monthly_stats['Month'].dt.strftime('%b')
+# builds the comprehensive graph without showing it
+# note this function is not as organized as buildGraph is
+def buildComprehensiveGraph(cube, propertyID, shownYears=None, title="Hotel Griffintown"):
+    year_colors = yearColors(selectYears(cube, propertyID, shownYears))
 
     today = date.today() 
 
@@ -91,33 +154,33 @@ def createComprehensiveGraph(monthlyStats):
     )
     # Year colors: (future/bold, past/faded)
 
-    add_bar_chart(fig,1, 1, 'occupancyPercent', "Occupancy %", year_colors, df_monthly_stats)
+    add_bar_chart(fig,1, 1, 'occupancyPercent', "Occupancy %", year_colors, cube, propertyID)
 
     # 2. Actual vs Possible Revenue
-    add_bar_chart(fig,1, 2, 'totalRevenue', "Actual Revenue", year_colors, df_monthly_stats)
-    add_bar_chart(fig,1, 2, 'possibleRevenue', "Possible Revenue", year_colors, df_monthly_stats)
+    add_bar_chart(fig,1, 2, 'totalRevenue', "Actual Revenue", year_colors, cube, propertyID)
+    add_bar_chart(fig,1, 2, 'possibleRevenue', "Possible Revenue", year_colors, cube, propertyID)
 
     # 3. Nights Rented vs Possible
-    add_bar_chart(fig,1, 3, 'nightsRented', "Nights Rented", year_colors, df_monthly_stats)
-    add_bar_chart(fig,1, 3, 'possibleNights', "Possible Nights", year_colors, df_monthly_stats)
+    add_bar_chart(fig,1, 3, 'nightsRented', "Nights Rented", year_colors, cube, propertyID)
+    add_bar_chart(fig,1, 3, 'possibleNights', "Possible Nights", year_colors, cube, propertyID)
 
     # 4. Number of Reservations
-    add_bar_chart(fig,2, 1, 'numReservations', "Reservations", year_colors, df_monthly_stats)
+    add_bar_chart(fig,2, 1, 'numReservations', "Reservations", year_colors, cube, propertyID)
 
     # 5. Average Daily Rate
-    add_line_chart(fig,2, 2, 'avgDailyRate', "Avg Daily Rate", year_colors, df_monthly_stats)
+    add_line_chart(fig,2, 2, 'avgDailyRate', "Avg Daily Rate", year_colors, cube, propertyID)
 
     # 6. RevPAR
-    add_line_chart(fig,2, 3, 'revPAR', "RevPAR", year_colors, df_monthly_stats)
+    add_line_chart(fig,2, 3, 'revPAR', "RevPAR", year_colors, cube, propertyID)
 
     # 7. Average Revenue per Reservation
-    add_line_chart(fig,3, 1, 'avgRevenue', "Avg Revenue/Reservation", year_colors, df_monthly_stats)
+    add_line_chart(fig,3, 1, 'avgRevenue', "Avg Revenue/Reservation", year_colors, cube, propertyID)
 
     # 8. Average Length of Stay
-    add_line_chart(fig,3, 2, 'avgLengthOfStay', "Avg Length of Stay", year_colors, df_monthly_stats)
+    add_line_chart(fig,3, 2, 'avgLengthOfStay', "Avg Length of Stay", year_colors, cube, propertyID)
 
     # 9. Booking Lead Time
-    add_line_chart(fig,3, 3, 'bookingLeadTime', "Booking Lead Time", year_colors, df_monthly_stats)
+    add_line_chart(fig,3, 3, 'bookingLeadTime', "Booking Lead Time", year_colors, cube, propertyID)
     today_month = today.month - 1  # Get 0-indexed month
     
     # Loop through each subplot and add the vertical line
@@ -134,7 +197,7 @@ def createComprehensiveGraph(monthlyStats):
     )
     # Update layout
     fig.update_layout(
-        title_text=f"Comprehensive Hotel Griffintown Analytics - {today.date()}",
+        title_text=f"Comprehensive {title} Analytics - {today}",
         title_x=0.5,
         height=1200,
         font_size=10,
@@ -158,11 +221,76 @@ def createComprehensiveGraph(monthlyStats):
 
     # Rotate x-axis labels for better readability
     fig.update_xaxes(tickangle=45)
-    fig.show()
+    return fig
+
+
+# booking pace of a stay month against the same month last year, read from the pace store
+# stayMonth is "YYYY-MM", next month by default
+def createPaceGraph(propertyID, stayMonth=None, maxDaysOut=180, shared=False):
+    outputPath = "../data/pace.html"
+    if stayMonth is None:
+        today = date.today()
+        stayMonth = date(today.year + today.month // 12, today.month % 12 + 1, 1).strftime("%Y-%m")
+
+    with metrics.span("load"):
+        history = paceStore.loadPace(propertyID)
+    if history is None:
+        print(f"{propertyID}: no pace history found, run paceStore.py backfill or record first")
+        return
+    with metrics.span("figure"):
+        fig = buildPaceGraph(history, stayMonth, maxDaysOut)
+
+    saveAndViewFig(fig, outputPath=outputPath, shared=shared)
+
+
+# one line per year for nights, revenue and reservations on the books, by days left before the month starts
+def buildPaceGraph(history, stayMonth, maxDaysOut=180, title="Werfy Luxury Apart-Hotel"):
+    year = int(stayMonth[:4])
+    month = int(stayMonth[5:7])
+    year_colors = yearColors([year - 1, year])
+
+    fig = make_subplots(
+        rows=len(paceStore.paceMetrics), cols=1,
+        shared_xaxes=True,
+        vertical_spacing=.08,
+        subplot_titles=("Nights On The Books", "Revenue On The Books", "Reservations On The Books"),
+    )
+    for paceYear, (pace_color, _) in year_colors.items():
+        daysOut, curves = history.pickupCurve(f"{paceYear}-{month:02d}", maxDaysOut)
+        for row, metric in enumerate(paceStore.paceMetrics, start=1):
+            # days before the history starts are left out
+            known = ~np.isnan(curves[metric])
+            fig.add_trace(
+                go.Scatter(
+                    x=daysOut[known].tolist(),
+                    y=roundValues(curves[metric][known], 2 if metric == "revenue" else 0),
+                    mode="lines",
+                    name=f"{month_abbr[month]} {paceYear}",
+                    legendgroup=str(paceYear),
+                    showlegend=row == 1,
+                    line=dict(color=pace_color, width=2),
+                ),
+                row=row, col=1
+            )
+
+    fig.update_layout(
+        title=go.layout.Title(
+            text=f"{title} - {month_abbr[month]} {year} Pace vs Last Year<br><sup>These analytics are generated on {date.today().strftime("%Y-%m-%d")}</sup>",
+            x=0.5,
+            xanchor="center",
+        ),
+        height=1200,
+        plot_bgcolor="#F5F5DC",
+        paper_bgcolor="#DBE8FF",
+    )
+    # the month gets closer from left to right
+    fig.update_xaxes(autorange="reversed", showgrid=False)
+    fig.update_xaxes(title_text="Days Before The Month Starts", row=len(paceStore.paceMetrics), col=1)
+    return fig
 
 
 # helper function to initialize a figure
-def initFigure(monthlyStats):
+def initFigure():
     # the num rows is te number of graphs to display - 2.
 # the extra 2 are at the top and bottom to allow for extra spacing
     numRows = 5
@@ -170,14 +298,6 @@ def initFigure(monthlyStats):
     rowHeights = [.1, 0.3, 0.1,0.4,0.1]
     # spacing between each row
     vertSpacing = .1
-    df_monthly_stats = pd.DataFrame.from_dict(monthlyStats, orient='index')
-    df_monthly_stats.index.name = 'Month'
-    df_monthly_stats.reset_index(inplace=True)
-
-    # Convert the 'Month' string to a datetime object and extract year and month name
-    df_monthly_stats['Month'] = pd.to_datetime(df_monthly_stats['Month'])
-    df_monthly_stats['Year'] = df_monthly_stats['Month'].dt.year
-    df_monthly_stats['MonthName'] = df_monthly_stats['Month'].dt.strftime('%b')
     fig = make_subplots(
         rows=numRows, cols=1,
         shared_xaxes=False,
@@ -193,22 +313,110 @@ def initFigure(monthlyStats):
         ),
         row_heights = rowHeights,
     )
-    return (fig, df_monthly_stats)
+    return fig
 
 
 # helper function to save the fig and view the HTML in default browser
-def saveAndViewFig(fig, outputPath):
-    fig.write_html(outputPath)
+def saveAndViewFig(fig, outputPath, shared=False):
+    writeHtml(fig, outputPath, shared)
+    viewHtml(outputPath)
+
+
+def viewHtml(outputPath):
     absolute_path = os.path.abspath(outputPath)
     # open the HTML in default browser
     webbrowser.open_new_tab(f"file://{absolute_path}")
 
+# write the figure as html
+# a standalone page embeds plotly.js (several megabytes) and the layout template in every file
+# a shared page links to one copy of each in assetsDir, so a report is only its own data
+def writeHtml(fig, outputPath, shared=False, assetsDir=sharedAssetsDir):
+    with metrics.span("html"):
+        if not shared:
+            fig.write_html(outputPath)
+        else:
+            outputDir = os.path.dirname(os.path.abspath(outputPath))
+            figure = serialization.loads(fig.to_json())
+            # the template is the same for every report, only a reference to it stays in the page
+            templateJs = f"var reportTemplate = {serialization.dumps(figure["layout"].pop("template", {})).decode("utf-8")};\n"
+            templateHash = hashlib.sha256(templateJs.encode("utf-8")).hexdigest()[:12]
+            plotlyPath = writeAsset(assetsDir, f"plotly-{plotly.__version__}.min.js", plotly.offline.get_plotlyjs)
+            templatePath = writeAsset(assetsDir, f"template-{templateHash}.js", lambda: templateJs)
+            html = reportPage.format(
+                plotlyPath=os.path.relpath(plotlyPath, outputDir),
+                templatePath=os.path.relpath(templatePath, outputDir),
+                # a </script> inside a string would end the script early
+                figureJson=serialization.dumps(figure).decode("utf-8").replace("</", "<\\/"),
+            )
+            with open(outputPath, "w", encoding="utf-8") as f:
+                f.write(html)
+    metrics.count("htmlBytes", os.path.getsize(outputPath))
+
+
+# key of a rendered figure in contentCache
+# besides the property's stats it depends on the day it is drawn (past and future months are coloured apart)
+# and, for shared html, on where the assets are from the page since it links to them by relative path
+def figureCacheKey(cube, propertyID, variant, shownYears, title, outputFormat, outputPath, shared):
+    linksAssets = shared and outputFormat == "html"
+    assetsPath = os.path.relpath(sharedAssetsDir, os.path.dirname(os.path.abspath(outputPath))) if linksAssets else None
+    return contentCache.makeKey([
+        "figure", variant, propertyID, cube.digest(propertyID), shownYears, title, outputFormat, assetsPath,
+        date.today().isoformat(), plotly.__version__, contentCache.codeVersion(figureModules),
+    ])
+
+
+# write a figure through the cache, on a hit the figure is not even built
+# buildFigure() makes the figure and writeFigure(fig, path) writes it, cacheKey None always builds it
+# a cached page that links to assets which have since been removed is built again, writing them back
+def writeCached(cacheKey, outputPath, buildFigure, writeFigure, linksAssets=False):
+    if cacheKey is not None:
+        with metrics.span("cache"):
+            hit = contentCache.copyOut("figures", cacheKey, outputPath)
+        if hit and (not linksAssets or assetsPresent(outputPath)):
+            metrics.count("cacheHits")
+            return
+    with metrics.span("figure"):
+        fig = buildFigure()
+    writeFigure(fig, outputPath)
+    if cacheKey is not None:
+        contentCache.storeFile("figures", cacheKey, outputPath)
+
+
+def assetsPresent(outputPath):
+    outputDir = os.path.dirname(os.path.abspath(outputPath))
+    with open(outputPath, encoding="utf-8") as f:
+        sources = re.findall(r'<script src="([^"]+)"', f.read())
+    return all(os.path.exists(os.path.join(outputDir, source)) for source in sources)
+
+
+# write a shared asset once, the name changes whenever the content does so a written asset never has to be replaced
+# several report processes can get here at the same time, each writes its own temp file and the rename is atomic
+def writeAsset(assetsDir, name, makeContent):
+    path = os.path.abspath(f"{assetsDir}/{name}")
+    if not os.path.exists(path):
+        os.makedirs(assetsDir, exist_ok=True)
+        tempPath = f"{path}.{os.getpid()}.tmp"
+        with open(tempPath, "w", encoding="utf-8") as f:
+            f.write(makeContent())
+        os.replace(tempPath, path)
+    return path
+
+
+# round chart values the same way for every chart so the embedded json stays short
+# whole numbers are written as ints, missing months stay out of the charts
+def roundValues(values, decimals):
+    rounded = np.round(values, decimals)
+    if decimals == 0:
+        return rounded.astype(np.int64).tolist()
+    return rounded.tolist()
+
+
 # helper function to update the layout. This is used for the simple graph 
-def updateLayout(fig):
+def updateLayout(fig, shownYears, title="Werfy Luxury Apart-Hotel"):
     chartHeights = 2500
     fig.update_layout(
     title=go.layout.Title(
-        text=f"Werfy Luxury Apart-Hotel - {years[0]}/{years[1]} Analytics<br><sup>These analytics are generated on {date.today().strftime("%Y-%m-%d")}</sup>" ,
+        text=f"{title} - {"/".join(str(year) for year in shownYears)} Analytics<br><sup>These analytics are generated on {date.today().strftime("%Y-%m-%d")}</sup>" ,
         xref="paper",
         x=0.5,
         xanchor="center",
@@ -227,49 +435,46 @@ def updateLayout(fig):
 
     fig.update_yaxes(title_text="Number of Reservation Nights", row=3, col=1)
     fig.update_xaxes(showgrid=False) 
+
+
+# short month names of month indexes, these are the x values of every chart
+def monthNames(monthIndexes):
+    return [month_abbr[month + 1] for month in monthIndexes]
+
+
 # helper function to create a line chart
-def add_line_chart(fig,row, col, y_col, name, year_colors, df_monthly_stats):
-    for year in years:
-        faded_color, base_color = year_colors[year]
-        
-        # Filter data for the specific year
-        year_data = df_monthly_stats[df_monthly_stats['Year'] == year].copy()
-        today = date.today()
-        # Separate data into past and future
-        past_data = year_data[year_data['Month'] <= pd.Timestamp(year, today.month, 1)]
-        future_data = year_data[year_data['Month'] >= pd.Timestamp(year, today.month, 1)]
+def add_line_chart(fig,row, col, y_col, name, year_colors, cube, propertyID):
+    currentMonth = date.today().month - 1
+    for year, (faded_color, base_color) in year_colors.items():
+        monthIndexes, values = cube.monthsWithData(propertyID, year, y_col)
+        # Separate data into past and future, this month is in both so the lines join up
+        past = monthIndexes <= currentMonth
+        future = monthIndexes >= currentMonth
 
         # Add the faded trace for past data
-        
-        if not past_data.empty:
-            past_data.loc[y_col] = past_data[y_col].round(0)
+        if past.any():
             fig.add_trace(
                 go.Scatter(
-                    x=past_data['MonthName'],
-                    y=past_data[y_col],
+                    x=monthNames(monthIndexes[past]),
+                    y=roundValues(values[past], 2),
                     mode="lines+markers",
                     name=f"{name} {year}",
                     line=dict(color=faded_color, width=2),
                     marker=dict(color=faded_color, size=8),
-                    # showlegend=True,
-                    
                 ),
                 row=row, col=col
             )
             
         # Add the bold trace for future data
-        if not future_data.empty:
-            future_data[y_col] = future_data[y_col]
+        if future.any():
             fig.add_trace(
                 go.Scatter(
-                    x=future_data['MonthName'],
-                    y=future_data[y_col],
+                    x=monthNames(monthIndexes[future]),
+                    y=roundValues(values[future], 2),
                     mode="lines+markers",
                     name=f"{name} {year}",
                     line=dict(color=base_color, width=2),
                     marker=dict(color=base_color, size=8, line=dict(width=2, color=base_color)),
-                    # showlegend=True
-
                 ),
                 row=row, col=col
             )
@@ -277,24 +482,16 @@ def add_line_chart(fig,row, col, y_col, name, year_colors, df_monthly_stats):
     fig.update_traces(row=row, col=col, textfont_size=12, textposition="top center", cliponaxis=False)
 
 # helper function to create a bar chart
-def add_bar_chart(fig,row, col, y_col, name, year_colors, df_monthly_stats):
-    for year in years:
-        mask = df_monthly_stats['Year'] == year
-        months = df_monthly_stats.loc[mask, 'Month']
-        values = df_monthly_stats.loc[mask, y_col]
-        faded_color, base_color = year_colors[year]
-        today = date.today()
-        
-        # The month_ts should be compared to the 'today' variable correctly
-        marker_colors = [
-            faded_color if m < pd.Timestamp(year, today.month, 1) else base_color
-            for m in months
-        ]
-        values = values.round(0) 
+def add_bar_chart(fig,row, col, y_col, name, year_colors, cube, propertyID):
+    currentMonth = date.today().month - 1
+    for year, (faded_color, base_color) in year_colors.items():
+        monthIndexes, values = cube.monthsWithData(propertyID, year, y_col)
+        # months before this one are in the past
+        marker_colors = [faded_color if month < currentMonth else base_color for month in monthIndexes]
         fig.add_trace(
             go.Bar(
-                x=df_monthly_stats.loc[mask, 'MonthName'],
-                y=values,
+                x=monthNames(monthIndexes),
+                y=roundValues(values, 0),
                 name=f"{name} {year}",
                 marker_color=marker_colors,
                 opacity=0.9
@@ -304,29 +501,19 @@ def add_bar_chart(fig,row, col, y_col, name, year_colors, df_monthly_stats):
 
     fig.update_traces(row=row,col=col,textfont_size=12, textposition="outside", cliponaxis=False)
 
-# helper function to add a table
-def add_table(fig, row, col, y_col, year_colors, df_monthly_stats):
-    df_monthly_stats['year'] = df_monthly_stats.Month.dt.year
-    df_monthly_stats['month_name'] = df_monthly_stats.Month.dt.strftime('%B')
-    ordered_months = [
-        'January', 'February', 'March', 'April', 'May', 'June',
-        'July', 'August', 'September', 'October', 'November', 'December'
+# helper function to add a table, one row per year and one column per month that has stats in any year
+def add_table(fig, row, col, y_col, year_colors, cube, propertyID):
+    yearValues = {year: np.round(cube.series(propertyID, year, y_col), 0) for year in year_colors}
+    months_columns = [month for month in range(12) if any(not np.isnan(values[month]) for values in yearValues.values())]
+    header_values = ['Year'] + [ordered_months[month] for month in months_columns]
+    # a month a year has no stats for is left blank
+    cell_values = [list(yearValues)] + [
+        ["" if np.isnan(values[month]) else int(values[month]) for values in yearValues.values()]
+        for month in months_columns
     ]
-    df_monthly_stats['month_name'] = pd.Categorical(df_monthly_stats['month_name'], categories=ordered_months, ordered=True)
-    df_pivoted = df_monthly_stats.pivot(index='year', columns='month_name', values=y_col).reset_index()
-    months_columns = [col for col in df_pivoted.columns if col in ordered_months]
-    for col_name in months_columns:
-        df_pivoted[col_name] = df_pivoted[col_name].round(0)
-    header_values = ['Year'] + months_columns
-    cell_values = [df_pivoted['year']] + [df_pivoted[month] for month in months_columns]
-
-    row_colors = []
-    for year in df_pivoted['year']:
-        if year in year_colors:
-            row_colors.append(year_colors[year][1])  # Use the faded color
-        else:
-            row_colors.append('rgba(242, 242, 242, 1)') # Default color if year not found
 
+    # Use the faded color of each year
+    row_colors = [year_colors[year][1] for year in yearValues]
     fill_colors = [row_colors] * len(months_columns)
 
     fig.add_trace(
@@ -343,17 +530,21 @@ def add_table(fig, row, col, y_col, year_colors, df_monthly_stats):
 # function to create annotations on the page
 # used for descriptions and legends
 
-def addAnnotations(fig):
+def addAnnotations(fig, year_colors):
+    shownYears = list(year_colors)
     # 0 is the bold color
-    colorYr1 = year_colors[years[0]][0]
-    colorYr2 = year_colors[years[1]][0]
-    legend = f"<span style='color:{colorYr1};'>&#9632;</span> {years[0]} | <span style='color:{colorYr2};'>&#9632;</span> {years[1]}<br><br>"
+    legend = " | ".join(f"<span style='color:{year_colors[year][0]};'>&#9632;</span> {year}" for year in shownYears) + "<br><br>"
+    # the latest year is compared to the ones before it
+    if len(shownYears) > 1:
+        comparison = f"{shownYears[-1]}'s performance compared to {", ".join(str(year) for year in shownYears[:-1])}"
+    else:
+        comparison = f"{shownYears[-1] if shownYears else date.today().year}'s performance"
     descriptions = [
     f"{legend}This chart displays the monthly occupancy rates. For future months, beginning in September, the data is less accurate. <br> This is because more reservations are typically made closer to the final date, meaning the data is not yet complete and is subject to change as more bookings are secured.",
     f"This table provides a detailed, year-over-year comparison of occupancy rates for each month.  <br> The information for upcoming months, starting in September, should be considered preliminary and less accurate. <br> As more reservations are made closer to the final date, this data is not yet complete and is expected to change.",
     f"{legend}This chart shows the number of reservation nights per month. This is a metric which shows how many nights have been booked. It is important to note that the data for future months, beginning in September, is less accurate.<br> Since more reservations are made closer to the final date, the data is not yet complete and does not include bookings that may be made in the coming weeks and months.",
     f"{legend}This chart shows the average length of a guest's stay.The data for future months, beginning in September, is less accurate.<br>  This is because more reservations are made closer to the final date, meaning the data is not yet complete and is expected to change as more bookings are finalized.",
-    f"This dashboard provides a comprehensive overview of {years[1]}'s performance compared to {years[0]}.<br> The information for upcoming months, beginning in September, is preliminary and less accurate.<br> This is because most reservations are made closer to the final date, meaning the data is not yet complete and is subject to change as more bookings are secured."
+    f"This dashboard provides a comprehensive overview of {comparison}.<br> The information for upcoming months, beginning in September, is preliminary and less accurate.<br> This is because most reservations are made closer to the final date, meaning the data is not yet complete and is subject to change as more bookings are secured."
     ]
     # grab all current annotations (titles)
     annotations = list(fig.layout.annotations)
@@ -407,4 +598,20 @@ def addAnnotations(fig):
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create the stats graphs")
+    parser.add_argument("--years", type=int, nargs="+", help="only show these years, by default every year in the stats is shown")
+    parser.add_argument("--shared-assets", action="store_true", help="link to one shared copy of plotly.js in data/assets instead of embedding it")
+    parser.add_argument("--no-cache", action="store_true", help="always render the graph, even when the stats are unchanged since the last run")
+    parser.add_argument("--pace", metavar="PROPERTY", help="plot the booking pace of a property against last year instead, from the pace store")
+    parser.add_argument("--stay-month", help="month to plot the pace of (YYYY-MM), next month by default")
+    parser.add_argument("--days-out", type=int, default=180, help="how many days before the month the pace plot starts")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+    if args.pace:
+        createPaceGraph(args.pace, args.stay_month, args.days_out, args.shared_assets)
+    else:
+        main(shownYears=args.years, shared=args.shared_assets, useCache=not args.no_cache)
+    metrics.finish("generateGraphs", args)
\ No newline at end of file
@@ -0,0 +1,73 @@
+import os
+import hashlib
+
+import numpy as np
+
+import serialization
+
+# every metric of the monthly stats in one array, values[property, year, month, metric]
+# months run from 0 (january) to 11 and a month without stats is NaN
+# it is built once from the stats and every chart reads its series straight out of it
+
+
+class MetricCube:
+    def __init__(self, statsByProperty):
+        self.properties = list(statsByProperty)
+        monthKeys = {month for stats in statsByProperty.values() for month in stats}
+        self.years = sorted({int(month[:4]) for month in monthKeys})
+        self.metrics = sorted({
+            metric
+            for stats in statsByProperty.values()
+            for monthStats in stats.values()
+            for metric in monthStats
+        })
+        self.propertyIndex = {propertyID: i for i, propertyID in enumerate(self.properties)}
+        self.yearIndex = {year: i for i, year in enumerate(self.years)}
+        self.metricIndex = {metric: i for i, metric in enumerate(self.metrics)}
+
+        self.values = np.full((len(self.properties), len(self.years), 12, len(self.metrics)), np.nan)
+        for propertyID, stats in statsByProperty.items():
+            propertyValues = self.values[self.propertyIndex[propertyID]]
+            for month, monthStats in stats.items():
+                monthValues = propertyValues[self.yearIndex[int(month[:4])], int(month[5:7]) - 1]
+                for metric, value in monthStats.items():
+                    monthValues[self.metricIndex[metric]] = value
+
+    # the 12 months of a metric in a year, NaN for the months without stats
+    def series(self, propertyID, year, metric):
+        if year not in self.yearIndex or metric not in self.metricIndex:
+            return np.full(12, np.nan)
+        return self.values[self.propertyIndex[propertyID], self.yearIndex[year], :, self.metricIndex[metric]]
+
+    # (month indexes, values) of only the months that have stats
+    def monthsWithData(self, propertyID, year, metric):
+        values = self.series(propertyID, year, metric)
+        monthIndexes = np.flatnonzero(~np.isnan(values))
+        return (monthIndexes, values[monthIndexes])
+
+    # the years a property has any stats for
+    def yearsWithData(self, propertyID):
+        propertyValues = self.values[self.propertyIndex[propertyID]]
+        return [year for year, yearValues in zip(self.years, propertyValues) if not np.isnan(yearValues).all()]
+
+    # hash of everything a property's charts are drawn from, two cubes with the same stats for it match
+    def digest(self, propertyID):
+        digest = hashlib.sha256(serialization.dumps([self.years, self.metrics]))
+        digest.update(self.values[self.propertyIndex[propertyID]].tobytes())
+        return digest.hexdigest()
+
+
+def fromMonthlyStats(monthlyStats, propertyID="all"):
+    return MetricCube({propertyID: monthlyStats})
+
+
+# cubes already built from stats files, keyed on the files and when they were last changed
+cubeCache = {}
+
+
+# the cube of {propertyID: stats file}, only rebuilt when one of the files changes
+def loadCube(statsPaths):
+    key = tuple((propertyID, path, os.path.getmtime(path)) for propertyID, path in statsPaths.items())
+    if key not in cubeCache:
+        cubeCache[key] = MetricCube({propertyID: serialization.load(path) for propertyID, path in statsPaths.items()})
+    return cubeCache[key]
@@ -0,0 +1,122 @@
+import os
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import serialization
+
+# lightweight timings and counters for every script
+# spans add up how often and how long a stage ran, counters add up amounts (pages, bytes, retries, ...)
+# nothing is written unless the script is run with --metrics, collecting is cheap enough to always do it
+# --profile STAGE also runs cProfile around every span of that stage and saves the stats next to the metrics
+
+metricsDir = "../data/metrics"
+
+lock = threading.Lock()
+spans = {}
+counters = {}
+startTime = time.perf_counter()
+startedAt = datetime.now()
+
+# stage name -> cProfile.Profile, filled by configure
+profiles = {}
+
+
+@contextmanager
+def span(name):
+    profile = profiles.get(name)
+    profiling = profile is not None and enableProfile(profile)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profiling:
+            profile.disable()
+        addSpan(name, 1, seconds, seconds)
+
+
+def addSpan(name, count, seconds, maxSeconds):
+    with lock:
+        stats = spans.get(name)
+        if stats is None:
+            spans[name] = {"count": count, "seconds": seconds, "maxSeconds": maxSeconds}
+            return
+        stats["count"] += count
+        stats["seconds"] += seconds
+        stats["maxSeconds"] = max(stats["maxSeconds"], maxSeconds)
+
+
+def count(name, amount=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+# only one profiler can run at a time, a span started while another stage is being profiled is timed but not profiled
+def enableProfile(profile):
+    try:
+        profile.enable()
+    except ValueError:
+        return False
+    return True
+
+
+# everything recorded so far, used to send a worker process's metrics back to its parent
+def snapshot():
+    with lock:
+        return {"spans": {name: dict(stats) for name, stats in spans.items()}, "counters": dict(counters)}
+
+
+def merge(other):
+    for name, stats in other["spans"].items():
+        addSpan(name, stats["count"], stats["seconds"], stats["maxSeconds"])
+    for name, amount in other["counters"].items():
+        count(name, amount)
+
+
+def reset():
+    global startTime, startedAt
+    with lock:
+        spans.clear()
+        counters.clear()
+    startTime = time.perf_counter()
+    startedAt = datetime.now()
+
+
+# the flags every script takes
+def addArguments(parser):
+    parser.add_argument("--metrics", action="store_true", help="write stage timings and counters to data/metrics")
+    parser.add_argument("--profile", action="append", default=[], metavar="STAGE", help="run cProfile around a stage (e.g. http, page, aggregate, html), can be given more than once")
+
+
+def configure(args):
+    for stage in args.profile:
+        profiles[stage] = cProfile.Profile()
+
+
+# write the metrics of this run as json, and the profile of every profiled stage as a .prof file
+# returns the path of the metrics file
+def writeMetrics(script, outputDir=metricsDir):
+    os.makedirs(outputDir, exist_ok=True)
+    # the process id keeps two runs started in the same second apart
+    stamp = f"{startedAt.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    path = f"{outputDir}/{script}-{stamp}.json"
+    report = snapshot()
+    report["script"] = script
+    report["startedAt"] = startedAt.strftime("%Y-%m-%d %H:%M:%S")
+    report["wallSeconds"] = time.perf_counter() - startTime
+    report["profiles"] = {}
+    for stage, profile in profiles.items():
+        profilePath = f"{outputDir}/{script}-{stamp}-{stage}.prof"
+        profile.dump_stats(profilePath)
+        report["profiles"][stage] = profilePath
+    serialization.dump(report, path, pretty=True)
+    return path
+
+
+# called at the end of a script's __main__
+def finish(script, args):
+    if args.metrics or args.profile:
+        print(f"metrics written to {writeMetrics(script)}")
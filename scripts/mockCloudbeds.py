@@ -0,0 +1,105 @@
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import serialization
+import syntheticData
+
+# a local stand in for the Cloudbeds api, point CLOUDBEDS_BASE_URL at it to measure fetch throughput
+# getReservationsWithRateDetails pages are generated on request from syntheticData, nothing is held in memory
+# modifiedFrom is ignored, every request sees the whole synthetic history
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class MockCloudbedsHandler(BaseHTTPRequestHandler):
+    # set by makeServer
+    reservationCounts = {}
+    seed = 0
+    latency = 0
+    errorRate = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endPoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        if self.latency:
+            time.sleep(self.latency)
+        # some requests fail the way an overloaded api does, so retries are part of the measurement
+        if self.errorRate and random.random() < self.errorRate:
+            self.send(503, {"success": False, "message": "mock outage"})
+            return
+        if endPoint != "getReservationsWithRateDetails":
+            self.send(404, {"success": False, "message": f"unknown endpoint {endPoint}"})
+            return
+        propertyID = params.get("propertyID")
+        if propertyID not in self.reservationCounts:
+            self.send(200, {"success": False, "message": f"unknown property {propertyID}"})
+            return
+
+        total = self.reservationCounts[propertyID]
+        pageSize = int(params.get("pageSize", DEFAULT_PAGE_SIZE))
+        pageNumber = int(params.get("pageNumber", 1))
+        first = min((pageNumber - 1) * pageSize, total)
+        last = min(first + pageSize, total)
+        data = list(syntheticData.generateReservations(propertyID, first, last, self.seed))
+        self.send(200, {"success": True, "data": data, "count": len(data), "total": total})
+
+    def send(self, status, body):
+        payload = serialization.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # keep the benchmark output readable
+    def log_message(self, format, *args):
+        pass
+
+
+# build a server for {propertyID: number of reservations}, port 0 picks a free port
+def makeServer(reservationCounts, port=0, seed=0, latency=0, errorRate=0):
+    handler = type("Handler", (MockCloudbedsHandler,), {
+        "reservationCounts": reservationCounts,
+        "seed": seed,
+        "latency": latency,
+        "errorRate": errorRate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def baseUrl(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+# serve from a background thread, call server.shutdown() when done
+def startServer(reservationCounts, port=0, seed=0, latency=0, errorRate=0):
+    server = makeServer(reservationCounts, port, seed, latency, errorRate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve synthetic reservations the way the Cloudbeds api does")
+    parser.add_argument("--room-nights", type=int, default=100000, help="about how many room-nights to serve across every property")
+    parser.add_argument("--properties", type=int, default=1, help="number of synthetic properties")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=0, help="port to listen on, 0 picks a free one")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    count = syntheticData.reservationsPerProperty(args.room_nights, args.properties)
+    counts = {propertyID: count for propertyID in syntheticData.syntheticPropertyIDs(args.properties)}
+    server = makeServer(counts, args.port, args.seed, args.latency, args.error_rate)
+    # the benchmark reads this line to find the port
+    print(f"listening on {baseUrl(server)}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,230 @@
+import os
+from bisect import bisect_right
+from datetime import date
+
+import numpy as np
+
+import serialization
+import metrics
+from config import propertyIDs, reservationsPath
+from reservationStore import readReservations
+from reservationModel import loadStays, monthKey, monthSegments
+
+# on the books history for booking pace
+# a snapshot is what was on the books for every stay month on one day: nights, revenue and reservations,
+# counted the same way as runStats (nights and revenue by night, a reservation in the month of its last night)
+# every property has one json lines file and each line only holds the months that changed since the line before:
+#   {"asOf": "2026-10-18", "changes": {"2026-11": [nights, revenue in cents, reservations], ...}}
+# so a day where a few bookings came in costs a few short entries instead of a full copy of the stats
+# revenue is kept in whole cents so adding the changes back up never drifts
+
+paceDir = "../data/pace"
+
+paceMetrics = ["nights", "revenue", "reservations"]
+
+
+def pacePath(propertyID):
+    return f"{paceDir}/{propertyID}.jsonl"
+
+
+# {"YYYY-MM": [nights, revenue in cents, reservations]} of the valid stays booked on or before asOfDay
+# asOfDay is a date ordinal, None counts every stay
+def onTheBooks(stays, asOfDay=None):
+    books = {}
+    for stay in stays:
+        if not stay.isValid or (asOfDay is not None and stay.dateBooked > asOfDay):
+            continue
+        addStay(books, stay)
+    return books
+
+
+def addStay(books, stay):
+    for yearMonth, fromDay, toDay in monthSegments(stay.checkIn, stay.checkOut):
+        monthBooks = books.setdefault(yearMonth, [0, 0, 0])
+        monthBooks[0] += toDay - fromDay
+        monthBooks[1] += round(stay.revenue(fromDay, toDay) * 100)
+    books.setdefault(monthKey(stay.lastNight), [0, 0, 0])[2] += 1
+
+
+# the months of books that differ from previous, as what has to be added to previous to get books
+def bookChanges(previous, books):
+    changes = {}
+    for yearMonth in sorted(set(previous) | set(books)):
+        old = previous.get(yearMonth, [0, 0, 0])
+        new = books.get(yearMonth, [0, 0, 0])
+        if old != new:
+            changes[yearMonth] = [newValue - oldValue for oldValue, newValue in zip(old, new)]
+    return changes
+
+
+# the books as of the last snapshot and the day of that snapshot (None when there is none yet)
+def latestBooks(propertyID):
+    books = {}
+    lastAsOf = None
+    path = pacePath(propertyID)
+    if not os.path.exists(path):
+        return (books, lastAsOf)
+    for entry in serialization.iterRecords(path):
+        applyChanges(books, entry["changes"])
+        lastAsOf = entry["asOf"]
+    return (books, lastAsOf)
+
+
+def applyChanges(books, changes):
+    for yearMonth, change in changes.items():
+        monthBooks = books.setdefault(yearMonth, [0, 0, 0])
+        for i, value in enumerate(change):
+            monthBooks[i] += value
+
+
+# take today's snapshot from the property's dataset and append what changed since the last one
+# a second snapshot on the same day is appended too, the later one wins when the history is read,
+# unless nothing changed since the first one
+# returns the number of months that changed
+def recordSnapshot(propertyID, asOf=None):
+    asOf = asOf or date.today()
+    previous, lastAsOf = latestBooks(propertyID)
+    if lastAsOf is not None and asOf.isoformat() < lastAsOf:
+        raise ValueError(f"{propertyID}: already has a snapshot from {lastAsOf}, snapshots can only be added in date order")
+    books = onTheBooks(loadStays(readReservations(reservationsPath(propertyID))), asOf.toordinal())
+    changes = bookChanges(previous, books)
+    if not changes and lastAsOf == asOf.isoformat():
+        return 0
+    os.makedirs(paceDir, exist_ok=True)
+    with open(pacePath(propertyID), "ab") as f:
+        f.write(serialization.dumpLine({"asOf": asOf.isoformat(), "changes": changes}))
+    return len(changes)
+
+
+# rebuild a property's history from startDate to today out of the booking dates in its dataset
+# only the current state of every reservation is known, so a stay cancelled since is missing from the days it
+# was still on the books; the history is exact from the day recordSnapshot starts being run every day
+def backfill(propertyID, startDate):
+    stays = [stay for stay in loadStays(readReservations(reservationsPath(propertyID))) if stay.isValid]
+    stays.sort(key=lambda stay: stay.dateBooked)
+    startDay = startDate.toordinal()
+    today = date.today().toordinal()
+
+    def entries():
+        # everything booked before the first day is its first snapshot, after that each day is what was booked on it
+        position = 0
+        for day in range(startDay, today + 1):
+            changes = {}
+            while position < len(stays) and stays[position].dateBooked <= day:
+                addStay(changes, stays[position])
+                position += 1
+            if changes or day == startDay:
+                yield {"asOf": date.fromordinal(day).isoformat(), "changes": dict(sorted(changes.items()))}
+
+    os.makedirs(paceDir, exist_ok=True)
+    serialization.dump(entries(), pacePath(propertyID), "jsonl")
+
+
+# the whole history of a property as one array, values[snapshot, stay month, metric]
+# built once by adding up the changes, a query is then a binary search for the snapshot and an index
+class PaceHistory:
+    def __init__(self, entries):
+        asOfDays = []
+        changesByDay = []
+        for entry in entries:
+            day = date.fromisoformat(entry["asOf"]).toordinal()
+            if asOfDays and asOfDays[-1] == day:
+                # a later snapshot of the same day replaces the earlier one
+                changesByDay[-1] = mergeChanges(changesByDay[-1], entry["changes"])
+                continue
+            asOfDays.append(day)
+            changesByDay.append(entry["changes"])
+
+        self.asOfDays = asOfDays
+        self.months = sorted({yearMonth for changes in changesByDay for yearMonth in changes})
+        self.monthIndex = {yearMonth: i for i, yearMonth in enumerate(self.months)}
+        deltas = np.zeros((len(asOfDays), len(self.months), len(paceMetrics)), dtype=np.int64)
+        for i, changes in enumerate(changesByDay):
+            for yearMonth, change in changes.items():
+                deltas[i, self.monthIndex[yearMonth]] = change
+        self.values = np.cumsum(deltas, axis=0)
+
+    # index of the last snapshot taken on or before day, -1 when there is none
+    def snapshotIndex(self, day):
+        return bisect_right(self.asOfDays, day) - 1
+
+    # {"YYYY-MM": {metric: value}} as it stood on asOf, revenue back in dollars
+    def booksAsOf(self, asOf):
+        i = self.snapshotIndex(asOf.toordinal())
+        if i < 0:
+            return {}
+        return {yearMonth: toMetrics(self.values[i, j]) for j, yearMonth in enumerate(self.months) if self.values[i, j].any()}
+
+    # the pickup curve of a stay month: what was on the books 0 to maxDaysOut days before the month started
+    # returns (days out, {metric: values}), days before the first snapshot or after the last one are NaN
+    def pickupCurve(self, stayMonth, maxDaysOut=180):
+        daysOut = np.arange(maxDaysOut + 1)
+        curves = {metric: np.full(len(daysOut), np.nan) for metric in paceMetrics}
+        if stayMonth not in self.monthIndex:
+            return (daysOut, curves)
+        monthStart = date.fromisoformat(f"{stayMonth}-01").toordinal()
+        days = monthStart - daysOut
+        snapshots = np.searchsorted(self.asOfDays, days, side="right") - 1
+        # a day after the last snapshot has not been recorded yet, it is not the latest books carried forward
+        known = (snapshots >= 0) & (days <= self.asOfDays[-1])
+        monthValues = self.values[snapshots[known], self.monthIndex[stayMonth]]
+        for i, metric in enumerate(paceMetrics):
+            curves[metric][known] = monthValues[:, i]
+        curves["revenue"] = curves["revenue"] / 100
+        return (daysOut, curves)
+
+
+def mergeChanges(first, second):
+    merged = {yearMonth: list(change) for yearMonth, change in first.items()}
+    applyChanges(merged, second)
+    return merged
+
+
+def toMetrics(values):
+    return {"nights": int(values[0]), "revenue": int(values[1]) / 100, "reservations": int(values[2])}
+
+
+# histories already read, keyed on the file and when it last changed
+historyCache = {}
+
+
+# None when the property has no history yet
+def loadPace(propertyID):
+    path = pacePath(propertyID)
+    if not os.path.exists(path):
+        return None
+    key = (path, os.path.getmtime(path))
+    if key not in historyCache:
+        historyCache[key] = PaceHistory(serialization.iterRecords(path))
+    return historyCache[key]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record on the books snapshots for booking pace, meant to run once a day")
+    parser.add_argument("command", choices=["record", "backfill", "show"], help="record today's snapshot, rebuild the history from booking dates, or print the books as of a day")
+    parser.add_argument("--property", action="append", dest="properties", help="only this property, can be given more than once")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(date.today().year - 2, 1, 1), help="first day of a backfill")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=date.today(), help="day to show the books of")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+
+    for propertyID in args.properties or propertyIDs:
+        if args.command == "record":
+            with metrics.span("pace"):
+                changed = recordSnapshot(propertyID)
+            print(f"{propertyID}: {changed} months changed")
+        elif args.command == "backfill":
+            with metrics.span("backfill"):
+                backfill(propertyID, args.start)
+            print(f"{propertyID}: {os.path.getsize(pacePath(propertyID))} bytes of history since {args.start}")
+        else:
+            with metrics.span("load"):
+                history = loadPace(propertyID)
+            if history is None:
+                print(f"{propertyID}: no pace history found, run paceStore.py backfill or record first")
+                continue
+            print(serialization.dumps({propertyID: history.booksAsOf(args.as_of)}, pretty=True).decode("utf-8"))
+    metrics.finish("paceStore", args)
@@ -0,0 +1,133 @@
+import os
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import reservationStore
+import projection
+import metrics
+from runStats import fillMonthStructure, aggregateBatch, finishStats, writeStats, batchSize
+from gatherReservations import API_KEY, MAX_WORKERS, getEndPoint, initalCall, fetchPages
+from cloudbedsClient import CloudbedsClient
+from config import propertyIDs, reservationsDir, reservationsPath
+
+# how many downloaded pages can wait for the aggregation before the fetcher stops and waits
+QUEUE_SIZE = int(os.environ.get("CLOUDBEDS_QUEUE_SIZE", 8))
+
+# put on the queue after the last page
+endOfPages = object()
+
+
+# download and aggregate in one go, pages are added to the stats while later pages are still downloading
+# the stats file is written as soon as the last page is in
+# saveDataset also writes the pages to the property's dataset the same way a full gatherReservations sync does
+def runPipeline(properties=propertyIDs, maxWorkers=MAX_WORKERS, engine="vectorized", saveDataset=False, outputFormat="json"):
+    os.makedirs(reservationsDir, exist_ok=True)
+
+    # one client and one page pool for every property, same as syncAllProperties
+    client = CloudbedsClient(API_KEY, maxWorkers)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as pagePool:
+        with ThreadPoolExecutor(max_workers=len(properties)) as propertyPool:
+            futures = [
+                propertyPool.submit(pipelineProperty, propertyID, client, pagePool, engine, saveDataset, outputFormat)
+                for propertyID in properties
+            ]
+            for future in futures:
+                future.result()
+
+
+def pipelineProperty(propertyID, client, pagePool, engine, saveDataset, outputFormat):
+    fullEndPoint = getEndPoint()
+    baseParams = {
+        "propertyID": propertyID,
+        "resultsFrom" : date(2020,1,1).isoformat()
+    }
+    monthlyStats = fillMonthStructure()
+
+    firstPage = 1
+    writer = None
+    if saveDataset:
+        writer = reservationStore.PageWriter(propertyID, "full", baseParams, datetime.now())
+        if writer.lastPage > 0:
+            # the pages already on disk from an interrupted sync are counted from the file instead of downloaded again
+            print(f"{propertyID}: resuming after page {writer.lastPage}")
+            for batch in reservationStore.readBatches(writer.partialPath, batchSize):
+                with metrics.span("aggregate"):
+                    aggregateBatch(batch, monthlyStats, engine)
+            firstPage = writer.lastPage + 1
+
+    with metrics.span("initialCall"):
+        loops = initalCall(client, fullEndPoint, baseParams)
+
+    # the fetcher fills the queue from its own thread while this thread aggregates
+    # a full queue blocks the fetcher, so a slow aggregation never lets pages pile up in memory
+    pageQueue = queue.Queue(maxsize=QUEUE_SIZE)
+    fetcher = threading.Thread(
+        target=producePages,
+        args=(pageQueue, client, fullEndPoint, baseParams, firstPage, loops, pagePool),
+        daemon=True,
+    )
+    fetcher.start()
+
+    count = 0
+    while True:
+        # time spent here means the aggregation is waiting on the network
+        with metrics.span("queueWait"):
+            item = pageQueue.get()
+        if item is endOfPages:
+            break
+        if isinstance(item, Exception):
+            raise item
+        pageNumber, data = item
+        metrics.count("pages")
+        metrics.count("reservations", len(data))
+        with metrics.span("page"):
+            for reservation in data:
+                reservation["propertyID"] = propertyID
+            with metrics.span("projection"):
+                reservations = projection.projectReservations(data)
+            if writer is not None:
+                with metrics.span("writePage"):
+                    writer.writePage(pageNumber, reservations)
+            with metrics.span("aggregate"):
+                aggregateBatch(reservations, monthlyStats, engine)
+        count += len(reservations)
+        print(f"{propertyID}: {pageNumber}/{loops} pages aggregated")
+    fetcher.join()
+
+    finishStats(monthlyStats, propertyID)
+    writeStats(monthlyStats, propertyID, outputFormat)
+    print(f"{propertyID}: stats written from {count} downloaded reservations")
+
+    if writer is not None:
+        writer.finish(reservationsPath(propertyID))
+        reservationStore.setHighWaterMark(propertyID, writer.highWaterMark())
+
+
+# runs in the fetcher thread, pages go on the queue in page order
+# an error is handed to the consumer so it is raised in the property thread instead of being lost
+def producePages(pageQueue, client, fullEndPoint, baseParams, firstPage, lastPage, pagePool):
+    try:
+        for page in fetchPages(client, fullEndPoint, baseParams, firstPage, lastPage, pagePool):
+            pageQueue.put(page)
+    except Exception as error:
+        pageQueue.put(error)
+        return
+    pageQueue.put(endOfPages)
+
+
+if(__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="Download reservations and calculate the monthly stats while the pages arrive")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="maximum number of pages fetched at the same time")
+    parser.add_argument("--property", action="append", dest="properties", help="only run this property, can be given more than once")
+    parser.add_argument("--engine", choices=["vectorized", "loop"], default="vectorized", help="how the reservations are aggregated")
+    parser.add_argument("--save-dataset", action="store_true", help="also write the downloaded reservations to the property's dataset")
+    parser.add_argument("--format", choices=["json", "snapshot"], default="json", help="write the stats as indented json or as a compressed snapshot")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+    runPipeline(properties=args.properties or propertyIDs, maxWorkers=args.workers, engine=args.engine, saveDataset=args.save_dataset, outputFormat=args.format)
+    metrics.finish("pipeline", args)
@@ -0,0 +1,34 @@
+import os
+import gzip
+
+from config import reservationSchema, rawArchiveDir
+import serialization
+
+
+# keep only the fields in schema, see reservationSchema in config
+def project(value, schema):
+    if schema is None or schema is True:
+        return value
+    if isinstance(value, list):
+        return [project(item, schema) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {field: project(value[field], fieldSchema) for field, fieldSchema in schema.items() if field in value}
+
+
+def projectReservations(reservations, schema=reservationSchema):
+    return [project(reservation, schema) for reservation in reservations]
+
+
+# where the raw pages of one sync of a property are archived
+def rawArchivePath(propertyID, syncStartTime):
+    return f"{rawArchiveDir}/{propertyID}/{syncStartTime.strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+
+
+# append the untouched reservations of a page to the compressed archive
+# every page is its own gzip member, which gzip readers treat as one continuous file
+def archiveRawPage(path, reservations):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "ab") as f:
+        for reservation in reservations:
+            f.write(serialization.dumpLine(reservation))
@@ -0,0 +1,154 @@
+import os
+import glob
+import argparse
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+import serialization
+import metrics
+import metricCube
+import generateGraphs
+from config import propertyIDs
+from statsAggregates import calculateMonthMetrics, additiveStats
+
+# renders every owner report without a display or a browser
+# each property and the portfolio total get a simple and a comprehensive report, rendered in parallel processes
+
+reportsDir = "../data/reports"
+portfolioID = "portfolio"
+
+variants = ["simple", "comprehensive"]
+# html is written by plotly itself, png and pdf go through kaleido (which needs a chrome install)
+formats = ["html", "png", "pdf"]
+
+# stats that add up across properties, the rest is worked out again from these
+portfolioInputs = additiveStats + ["possibleNights"]
+
+
+# the newest stats file runStats wrote for a property, json or snapshot
+def latestStatsFile(propertyID, dataDir="../data"):
+    candidates = glob.glob(f"{dataDir}/*_months_{propertyID}.json") + glob.glob(f"{dataDir}/*_months_{propertyID}.snap")
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+# monthlyStats of the whole portfolio, the additive stats are summed and the ratios worked out from the sums
+# months only some properties have stats for are totalled over those properties
+# a month without every input (the csv history only has occupancy and nights) is left out rather than counted as zero
+def portfolioStats(statsByProperty):
+    totals = {}
+    for stats in statsByProperty.values():
+        for month, monthStats in stats.items():
+            if any(stat not in monthStats for stat in portfolioInputs):
+                continue
+            monthTotals = totals.setdefault(month, {stat: 0 for stat in portfolioInputs})
+            for stat in portfolioInputs:
+                monthTotals[stat] += monthStats[stat]
+    return {month: calculateMonthMetrics(stats, stats["possibleNights"]) for month, stats in sorted(totals.items())}
+
+
+# set in every worker process once, so the cube is not sent along with every job
+workerCube = None
+
+
+def initWorker(cube):
+    global workerCube
+    workerCube = cube
+
+
+# runs in a worker, renders one report in every format asked for
+# returns the paths written, the formats that failed with why and the job's metrics
+# shared html links to the plotly.js in generateGraphs.sharedAssetsDir instead of embedding it
+# formats already rendered from the same stats come out of contentCache, the figure is only built when one is missing
+def renderReport(propertyID, variant, outputFormats, shownYears, outputDir, shared, useCache=True):
+    metrics.reset()
+    title = "Portfolio" if propertyID == portfolioID else f"Property {propertyID}"
+    figures = []
+
+    def buildFigure():
+        if not figures:
+            if variant == "simple":
+                figures.append(generateGraphs.buildGraph(workerCube, propertyID, shownYears, title))
+            else:
+                figures.append(generateGraphs.buildComprehensiveGraph(workerCube, propertyID, shownYears, title))
+        return figures[0]
+
+    written = []
+    failed = {}
+    basePath = f"{outputDir}/{propertyID}-{variant}"
+    for outputFormat in outputFormats:
+        path = f"{basePath}.{outputFormat}"
+        cacheKey = generateGraphs.figureCacheKey(workerCube, propertyID, variant, shownYears, title, outputFormat, path, shared) if useCache else None
+        try:
+            with metrics.span(outputFormat):
+                if outputFormat == "html":
+                    generateGraphs.writeCached(cacheKey, path, buildFigure, lambda fig, path: generateGraphs.writeHtml(fig, path, shared), shared)
+                else:
+                    generateGraphs.writeCached(cacheKey, path, buildFigure, lambda fig, path: fig.write_image(path))
+        except Exception as error:
+            failed[outputFormat] = str(error).strip().splitlines()[0]
+            continue
+        written.append(path)
+    return (written, failed, metrics.snapshot())
+
+
+# render every report of the given properties plus the portfolio total
+# statsPaths maps a property to its stats file, properties without one are skipped
+# returns the number of reports that could not be rendered in every format
+def renderReports(statsPaths, selectedVariants=variants, outputFormats=["html"], shownYears=None, workers=None, outputDir=None, shared=True, useCache=True):
+    outputDir = outputDir or f"{reportsDir}/{date.today().isoformat()}"
+    os.makedirs(outputDir, exist_ok=True)
+
+    with metrics.span("cube"):
+        statsByProperty = {propertyID: serialization.load(path) for propertyID, path in statsPaths.items()}
+        if len(statsByProperty) > 1:
+            statsByProperty[portfolioID] = portfolioStats(statsByProperty)
+        cube = metricCube.MetricCube(statsByProperty)
+
+    jobs = [(propertyID, variant) for propertyID in cube.properties for variant in selectedVariants]
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(cube,)) as pool:
+        futures = [pool.submit(renderReport, propertyID, variant, outputFormats, shownYears, outputDir, shared, useCache) for propertyID, variant in jobs]
+        for (propertyID, variant), future in zip(jobs, futures):
+            written, failed, reportMetrics = future.result()
+            metrics.merge(reportMetrics)
+            metrics.count("reports")
+            for path in written:
+                print(f"{propertyID} {variant}: {path}")
+            for outputFormat, reason in failed.items():
+                print(f"{propertyID} {variant}: {outputFormat} failed: {reason}")
+            if failed:
+                failures += 1
+    return failures
+
+
+if(__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="Render every owner report headlessly, in parallel")
+    parser.add_argument("--property", action="append", dest="properties", help="only report on this property, can be given more than once")
+    parser.add_argument("--stats", action="append", default=[], metavar="PROPERTY=PATH", help="stats file of a property, by default the newest runStats output is used")
+    parser.add_argument("--variants", nargs="+", choices=variants, default=variants)
+    parser.add_argument("--formats", nargs="+", choices=formats, default=["html"], help="png and pdf need kaleido and chrome")
+    parser.add_argument("--years", type=int, nargs="+", help="only show these years, by default every year in the stats is shown")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to one per core")
+    parser.add_argument("--output", help="directory the reports are written to, defaults to data/reports/<today>")
+    parser.add_argument("--standalone", action="store_true", help="embed plotly.js in every html report instead of linking to the shared copy in data/assets")
+    parser.add_argument("--no-cache", action="store_true", help="render every report again, even when its stats are unchanged since the last run")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+
+    statsPaths = dict(entry.split("=", 1) for entry in args.stats)
+    # with only --stats given just those properties are reported on
+    for propertyID in args.properties or ([] if statsPaths else propertyIDs):
+        if propertyID not in statsPaths:
+            path = latestStatsFile(propertyID)
+            if path is None:
+                print(f"{propertyID}: no stats file found, run runStats.py first")
+                continue
+            statsPaths[propertyID] = path
+
+    failures = renderReports(statsPaths, args.variants, args.formats, args.years, args.workers, args.output, not args.standalone, not args.no_cache) if statsPaths else 0
+    metrics.finish("reports", args)
+    if failures:
+        raise SystemExit(f"{failures} reports could not be rendered in every format")
@@ -0,0 +1,120 @@
+import math
+from array import array
+from datetime import date
+from enum import IntEnum
+from functools import lru_cache
+
+
+# room statuses as small ints instead of strings
+class RoomStatus(IntEnum):
+    IN_HOUSE = 0
+    NOT_CHECKED_IN = 1
+    CHECKED_OUT = 2
+    CANCELED = 3
+    NO_SHOW = 4
+    OTHER = 5
+
+
+statusByName = {
+    "in_house": RoomStatus.IN_HOUSE,
+    "not_checked_in": RoomStatus.NOT_CHECKED_IN,
+    "checked_out": RoomStatus.CHECKED_OUT,
+    "canceled": RoomStatus.CANCELED,
+    "no_show": RoomStatus.NO_SHOW,
+}
+
+# same as validStatus in runStats, every other status counts as a cancellation
+validStatuses = frozenset((RoomStatus.IN_HOUSE, RoomStatus.NOT_CHECKED_IN, RoomStatus.CHECKED_OUT))
+
+
+# one room of a reservation, parsed once when it is loaded
+# dates are day ordinals (date.toordinal) and rates is the nightly rate indexed by night,
+# rates[0] is the night of the check in; a night cloudbeds sent no rate for is NaN
+class RoomStay:
+    __slots__ = ("reservationID", "propertyID", "checkIn", "checkOut", "status", "dateBooked", "rates")
+
+    def __init__(self, reservationID, propertyID, checkIn, checkOut, status, dateBooked, rates):
+        self.reservationID = reservationID
+        self.propertyID = propertyID
+        self.checkIn = checkIn
+        self.checkOut = checkOut
+        self.status = status
+        self.dateBooked = dateBooked
+        self.rates = rates
+
+    @property
+    def isValid(self):
+        return self.status in validStatuses
+
+    @property
+    def nights(self):
+        return max(self.checkOut - self.checkIn, 0)
+
+    # the night the reservation is counted in, a stay without nights is counted on its check in day
+    @property
+    def lastNight(self):
+        return self.checkOut - 1 if self.checkOut > self.checkIn else self.checkIn
+
+    @property
+    def leadTime(self):
+        return self.checkIn - self.dateBooked
+
+    # revenue of the nights in [fromDay, toDay), missing rates raise like the dict lookup they replace
+    def revenue(self, fromDay, toDay):
+        total = math.fsum(self.rates[fromDay - self.checkIn:toDay - self.checkIn])
+        if math.isnan(total):
+            raise KeyError(f"detailedRoomRates of reservation {self.reservationID} is missing a night")
+        return total
+
+
+# turn an api reservation into its room stays
+def fromReservation(reservation):
+    dateBooked = dayOrdinal(reservation["dateCreated"][:10])
+    stays = []
+    for room in reservation["rooms"]:
+        checkIn = dayOrdinal(room["roomCheckIn"])
+        checkOut = dayOrdinal(room["roomCheckOut"])
+        rates = array("d", [math.nan]) * max(checkOut - checkIn, 0)
+        for night, rate in room["detailedRoomRates"].items():
+            offset = dayOrdinal(night) - checkIn
+            if 0 <= offset < len(rates):
+                rates[offset] = rate
+        stays.append(RoomStay(
+            reservation.get("reservationID"),
+            reservation.get("propertyID"),
+            checkIn,
+            checkOut,
+            statusByName.get(room["roomStatus"], RoomStatus.OTHER),
+            dateBooked,
+            rates,
+        ))
+    return stays
+
+
+def loadStays(reservations):
+    stays = []
+    for reservation in reservations:
+        stays.extend(fromReservation(reservation))
+    return stays
+
+
+# the same few thousand dates are parsed over and over, so they are cached
+@lru_cache(maxsize=None)
+def dayOrdinal(isoDate):
+    return date.fromisoformat(isoDate).toordinal()
+
+
+@lru_cache(maxsize=None)
+def monthKey(ordinal):
+    return date.fromordinal(ordinal).strftime("%Y-%m")
+
+
+# splits [fromDay, toDay) at month boundaries, yields ("YYYY-MM", first day, day after the last day)
+def monthSegments(fromDay, toDay):
+    current = fromDay
+    while current < toDay:
+        day = date.fromordinal(current)
+        nextMonth = date(day.year + day.month // 12, day.month % 12 + 1, 1).toordinal()
+        segmentEnd = min(nextMonth, toDay)
+        yield (monthKey(current), current, segmentEnd)
+        current = segmentEnd
@@ -0,0 +1,174 @@
+import os
+import threading
+from datetime import datetime
+
+from config import reservationsDir, reservationsPath
+import serialization
+
+# the high water mark of the last successful sync of each property
+syncStatePath = f"{reservationsDir}/syncState.json"
+syncStateFormat = "%Y-%m-%d %H:%M:%S"
+
+# properties sync in parallel threads, this keeps them from overwriting each others marks
+syncStateLock = threading.Lock()
+
+
+# reads a reservation file one reservation at a time so the whole history never has to sit in memory
+# works for the line delimited datasets, record snapshots and the older files that hold one big (indented) json array
+def readReservations(path):
+    return serialization.iterRecords(path)
+
+
+# the same reservations in lists of at most batchSize, for code that works on a batch at a time
+def readBatches(path, batchSize):
+    batch = []
+    for reservation in readReservations(path):
+        batch.append(reservation)
+        if len(batch) == batchSize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# writes pages to disk as they arrive and keeps a checkpoint of the last completed page
+# if the sync dies the next run with the same params picks up after that page
+# mode is "full" for a complete download or "delta" for an incremental one
+class PageWriter:
+    def __init__(self, propertyID, mode, params, syncStartTime):
+        self.propertyID = propertyID
+        self.partialPath = f"{reservationsDir}/{propertyID}.{mode}.jsonl.partial"
+        self.checkpointPath = f"{reservationsDir}/{propertyID}.{mode}.checkpoint.json"
+        self.params = params
+        self.syncStartTime = syncStartTime
+        self.lastPage = 0
+        self.count = 0
+        # the newest dateModified written, kept as the api sent it
+        self.lastModified = None
+
+        checkpoint = self.readCheckpoint()
+        if checkpoint is not None and checkpoint["params"] == params and os.path.exists(self.partialPath):
+            # anything past the offset is a page that was only half written, drop it
+            self.lastPage = checkpoint["lastPage"]
+            self.count = checkpoint["count"]
+            self.lastModified = checkpoint.get("lastModified")
+            self.syncStartTime = datetime.strptime(checkpoint["syncStartTime"], syncStateFormat)
+            self.file = open(self.partialPath, "r+b")
+            self.file.truncate(checkpoint["offset"])
+            self.file.seek(checkpoint["offset"])
+        else:
+            self.file = open(self.partialPath, "wb")
+
+    # the checkpoint is only trusted if it was written for the same request
+    def readCheckpoint(self):
+        if not os.path.exists(self.checkpointPath):
+            return None
+        return serialization.load(self.checkpointPath)
+
+    # append a page and move the checkpoint past it
+    # pages have to be written in order so the checkpoint always points at a complete prefix
+    def writePage(self, pageNumber, reservations):
+        self.file.write(b"".join(serialization.dumpLine(reservation) for reservation in reservations))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.lastPage = pageNumber
+        self.count += len(reservations)
+        for reservation in reservations:
+            modified = reservation.get("dateModified")
+            if modified and (self.lastModified is None or modified > self.lastModified):
+                self.lastModified = modified
+
+        checkpoint = {
+            "params": self.params,
+            "syncStartTime": self.syncStartTime.strftime(syncStateFormat),
+            "lastPage": self.lastPage,
+            "count": self.count,
+            "offset": self.file.tell(),
+            "lastModified": self.lastModified,
+        }
+        serialization.dump(checkpoint, self.checkpointPath)
+
+    # the mark the next incremental sync starts from, the newest dateModified that was downloaded
+    # it comes from the api's clock, so a local clock or timezone that differs from it never skips changes
+    # fallback is the mark the sync started from, the mark never moves back past it (the overlap downloads older changes)
+    def highWaterMark(self, fallback=None):
+        if self.lastModified is None:
+            return fallback
+        lastModified = datetime.strptime(self.lastModified, syncStateFormat)
+        return max(lastModified, fallback) if fallback is not None else lastModified
+
+    # every page is on disk, move the file to where it belongs and forget the checkpoint
+    def finish(self, outputPath):
+        self.file.close()
+        os.replace(self.partialPath, outputPath)
+        if os.path.exists(self.checkpointPath):
+            os.remove(self.checkpointPath)
+
+
+# upsert a downloaded delta into the property dataset
+# only the delta is held in memory, the existing dataset is streamed through line by line
+# onChange is called with (old, new) for every reservation that changed, old is None for new ones
+# returns (number inserted, number updated)
+# the dataset is left untouched when nothing changed, so whatever watches its mtime does not reload it for nothing
+def mergeDelta(propertyID, deltaPath, onChange=None):
+    delta = {}
+    for reservation in readReservations(deltaPath):
+        delta[reservation["reservationID"]] = reservation
+
+    path = reservationsPath(propertyID)
+    # readReservations treats a missing file as empty, the delta would silently become the whole dataset
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{propertyID}: no dataset at {path} to merge the delta into, run a full sync")
+    if not delta:
+        os.remove(deltaPath)
+        return (0, 0)
+
+    tempPath = f"{path}.tmp"
+    updated = 0
+    with open(tempPath, "wb") as f:
+        for reservation in readReservations(path):
+            # a newer copy of this reservation was downloaded, write that one instead
+            newer = delta.pop(reservation["reservationID"], None)
+            # the sync overlap downloads some reservations again, an identical copy is not an update
+            if newer is not None and newer != reservation:
+                updated += 1
+                if onChange is not None:
+                    onChange(reservation, newer)
+                reservation = newer
+            f.write(serialization.dumpLine(reservation))
+        # whatever is left was never seen before
+        for reservation in delta.values():
+            if onChange is not None:
+                onChange(None, reservation)
+            f.write(serialization.dumpLine(reservation))
+    if delta or updated:
+        os.replace(tempPath, path)
+    else:
+        os.remove(tempPath)
+    os.remove(deltaPath)
+    return (len(delta), updated)
+
+
+# returns the datetime of the last successful sync or None if there was none
+def getHighWaterMark(propertyID):
+    with syncStateLock:
+        state = readSyncState()
+    if propertyID not in state:
+        return None
+    return datetime.strptime(state[propertyID], syncStateFormat)
+
+
+# a sync that downloaded nothing and had no mark before leaves the state as it is
+def setHighWaterMark(propertyID, syncTime):
+    if syncTime is None:
+        return
+    with syncStateLock:
+        state = readSyncState()
+        state[propertyID] = syncTime.strftime(syncStateFormat)
+        serialization.dump(state, syncStatePath, pretty=True)
+
+
+def readSyncState():
+    if not os.path.exists(syncStatePath):
+        return {}
+    return serialization.load(syncStatePath)
@@ -0,0 +1,167 @@
+import numpy as np
+
+import metrics
+
+
+# columnar version of runStats.processData
+# rooms are flattened into arrays once and every stat is a grouped reduction over them
+# the results are added into monthlyStats exactly the way the loop in processData does it
+def processData(data, monthlyStats, windowStart, windowEnd, validStatus):
+    with metrics.span("roomTable"):
+        table = buildRoomTable(data)
+    if len(table["checkIn"]) == 0:
+        return
+
+    # months we keep stats for, as months since 1970 so they can be compared with the day arrays
+    monthKeys = list(monthlyStats.keys())
+    monthNumbers = np.array(monthKeys, dtype="datetime64[M]").astype(np.int64)
+
+    checkIn = table["checkIn"]
+    checkOut = table["checkOut"]
+
+    # same rule as isDateValid, skip rooms outside the period we are searching
+    windowStartDay = np.datetime64(windowStart, "D").astype(np.int64)
+    windowEndDay = np.datetime64(windowEnd, "D").astype(np.int64)
+    inWindow = ~((checkIn >= windowEndDay) | (checkOut <= windowStartDay))
+    isValidStatus = np.isin(table["status"], validStatus)
+
+    # cancelled rooms are counted in the month they were supposed to check in
+    cancelled = inWindow & ~isValidStatus
+    addCounts(monthlyStats, monthKeys, monthNumbers, "cancelledReservations", toMonth(checkIn[cancelled]))
+
+    active = np.flatnonzero(inWindow & isValidStatus)
+    activeCheckIn = checkIn[active]
+    activeCheckOut = checkOut[active]
+    nights = np.maximum(activeCheckOut - activeCheckIn, 0)
+
+    # one row per night rented, walking each stay day by day like the loop does
+    nightDays = expandNights(activeCheckIn, nights)
+    metrics.count("roomNights", len(nightDays))
+    addCounts(monthlyStats, monthKeys, monthNumbers, "nightsRented", toMonth(nightDays))
+
+    # the loop leaves its month on the last night of the stay, so the reservation and its lead time land there
+    lastNight = np.where(nights > 0, activeCheckOut - 1, activeCheckIn)
+    reservationMonths = toMonth(lastNight)
+    addCounts(monthlyStats, monthKeys, monthNumbers, "numReservations", reservationMonths)
+    leadTimes = activeCheckIn - table["dateCreated"][active]
+    addSums(monthlyStats, monthKeys, monthNumbers, "totalBookingLeadTime", reservationMonths, leadTimes)
+
+    addRevenue(monthlyStats, monthKeys, monthNumbers, table, active, nights)
+
+
+# flatten reservations into one entry per room
+# dates are parsed in bulk by numpy and kept as days since 1970
+def buildRoomTable(data):
+    checkIns = []
+    checkOuts = []
+    statuses = []
+    datesCreated = []
+    # every nightly rate of every room, rateRooms says which room the rate belongs to
+    rateRooms = []
+    rateDates = []
+    rateValues = []
+
+    for row in data:
+        # only the date part of dateCreated matters for lead time
+        dateCreated = row["dateCreated"][:10]
+        for room in row["rooms"]:
+            roomIndex = len(checkIns)
+            checkIns.append(room["roomCheckIn"])
+            checkOuts.append(room["roomCheckOut"])
+            statuses.append(room["roomStatus"])
+            datesCreated.append(dateCreated)
+            rates = room["detailedRoomRates"]
+            rateRooms.extend([roomIndex] * len(rates))
+            rateDates.extend(rates.keys())
+            rateValues.extend(rates.values())
+
+    return {
+        "checkIn": toDays(checkIns),
+        "checkOut": toDays(checkOuts),
+        "status": np.array(statuses, dtype=object),
+        "dateCreated": toDays(datesCreated),
+        "rateRoom": np.array(rateRooms, dtype=np.int64),
+        "rateDay": toDays(rateDates),
+        "rateValue": np.array(rateValues, dtype=np.float64),
+    }
+
+
+# revenue is summed night by night in the same order as the loop
+# float addition is not associative, so this keeps the totals identical to the cent and beyond
+def addRevenue(monthlyStats, monthKeys, monthNumbers, table, active, nights):
+    # keep only the rates of active rooms for nights inside their stay
+    roomPosition = np.full(len(table["checkIn"]), -1, dtype=np.int64)
+    roomPosition[active] = np.arange(len(active))
+    ratePosition = roomPosition[table["rateRoom"]]
+    rateDay = table["rateDay"]
+    keep = ratePosition >= 0
+    keep[keep] = (rateDay[keep] >= table["checkIn"][table["rateRoom"][keep]]) & (rateDay[keep] < table["checkOut"][table["rateRoom"][keep]])
+
+    ratePosition = ratePosition[keep]
+    rateDay = rateDay[keep]
+    rateValue = table["rateValue"][keep]
+    rateMonth = toMonth(rateDay)
+
+    # months that are not being tracked are skipped
+    tracked = np.isin(rateMonth, monthNumbers)
+    ratePosition = ratePosition[tracked]
+    rateDay = rateDay[tracked]
+    rateValue = rateValue[tracked]
+    rateMonth = rateMonth[tracked]
+
+    # the loop looks every night up in detailedRoomRates, a missing night is an error there too
+    nightMonths = toMonth(expandNights(table["checkIn"][active], nights))
+    if len(rateValue) != np.count_nonzero(np.isin(nightMonths, monthNumbers)):
+        raise KeyError("detailedRoomRates is missing a night of a reservation")
+
+    # room by room, night by night, the order the loop adds them in
+    order = np.lexsort((rateDay, ratePosition))
+    rateValue = rateValue[order]
+    rateMonth = rateMonth[order]
+
+    for monthKey, monthNumber in zip(monthKeys, monthNumbers):
+        values = rateValue[rateMonth == monthNumber]
+        if len(values) == 0:
+            continue
+        # cumsum adds strictly left to right, starting from what is already in the month
+        start = monthlyStats[monthKey]["totalRevenue"]
+        monthlyStats[monthKey]["totalRevenue"] = float(np.cumsum(np.concatenate(([start], values)))[-1])
+
+
+# day of every night of every stay, stays are given as first night and number of nights
+def expandNights(firstNights, nights):
+    total = int(nights.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    stayStarts = np.repeat(firstNights, nights)
+    # position of each night inside its own stay
+    offsets = np.arange(total) - np.repeat(np.cumsum(nights) - nights, nights)
+    return stayStarts + offsets
+
+
+# add one to the month of every entry, months that are not being tracked are skipped
+def addCounts(monthlyStats, monthKeys, monthNumbers, stat, months):
+    addSums(monthlyStats, monthKeys, monthNumbers, stat, months, np.ones(len(months), dtype=np.int64))
+
+
+def addSums(monthlyStats, monthKeys, monthNumbers, stat, months, values):
+    if len(months) == 0:
+        return
+    sorter = np.argsort(monthNumbers)
+    positions = np.searchsorted(monthNumbers, months, sorter=sorter)
+    positions = np.minimum(positions, len(monthNumbers) - 1)
+    matched = monthNumbers[sorter[positions]] == months
+    totals = np.bincount(sorter[positions[matched]], weights=values[matched], minlength=len(monthKeys))
+    for monthKey, total in zip(monthKeys, totals):
+        # integer stats stay integers, exactly like counting one by one
+        monthlyStats[monthKey][stat] += int(total)
+
+
+# "YYYY-MM-DD" strings to days since 1970
+def toDays(dates):
+    return np.array(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+# days since 1970 to months since 1970
+def toMonth(days):
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
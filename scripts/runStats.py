@@ -1,10 +1,11 @@
 import os
+import sys
+import argparse
 from dotenv import load_dotenv
 import pandas as pd
-import json
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
-from calendar import monthrange
+from concurrent.futures import ProcessPoolExecutor
 
 
 
@@ -13,14 +14,20 @@ load_dotenv()
 # Use your direct API key
 API_KEY = os.environ.get("CLOUDBEDS_API_KEY")
 
-propertyIDs =[
-    "214969",
-    "295812",
-    "215018",
-    "317876",
-    "318157"
-]
-monthlyStats = {}
+from config import propertyIDs, reservationsPath
+from reservationStore import readBatches
+import roomNightEngine
+import warehouse
+import serialization
+import metrics
+import contentCache
+import config
+import reservationStore
+import statsAggregates
+import calendarDimension
+import reservationModel
+from reservationModel import dayOrdinal
+from statsAggregates import calculateMonthMetrics, additiveStats
 
 # this number includes current month
 monthNum = date.today().month
@@ -30,26 +37,173 @@ year = date.today().year
 totalStartDate = date.today()
 
 validStatus = ["in_house", "not_checked_in", "checked_out"]
-# data[rooms].roomCheckIn
-def main():
-    fillMonthStructure()
-    # where the reservation data is being stored (JSON)
-    reservationJSON = "../data/reservations.json"
-    # format the start date
-    today = totalStartDate.strftime("%m-%d-%Y")
-    
-    # create output json name based on todays date
-    outputName = f"{today}_{numMonthsLookAhead}_months"
-    outputJSON = f"../data/{outputName}.json"
 
-    # load the reservations into reservations variable
-    with open(reservationJSON, "r", encoding="utf-8") as f:
-        reservations = json.load(f)
+# how many reservations are aggregated at a time
+batchSize = 10000
 
-    processData(reservations)
-    
+# the stats files are indented json by default, snapshots are compressed and binary
+statsExtensions = {"json": "json", "snapshot": "snap"}
+
+# the code the stats depend on, an edit to any of these makes every cached copy of the stats stale
+# every module this one imports the stats from, and the ones those import in turn
+statsModules = [sys.modules[__name__], config, calendarDimension, reservationModel, reservationStore, roomNightEngine, statsAggregates, serialization, warehouse]
+# data[rooms].roomCheckIn
+# engine is "vectorized" for the columnar engine in roomNightEngine or "loop" for processData below
+# source is "dataset" to read the property's json lines file or "warehouse" to query the sqlite warehouse
+# inputPath reads another reservation file instead of the property's dataset, json lines or a json array
+# outputFormat is "json" or "snapshot", see serialization
+# useCache reuses the stats of an earlier run when the reservations, the window and the code are all unchanged
+def main(propertyID=propertyIDs[0], engine="vectorized", source="dataset", inputPath=None, outputFormat="json", useCache=True):
+    cacheKey = statsCacheKey(propertyID, engine, source, inputPath) if useCache else None
+    monthlyStats = cachedStats(propertyID, cacheKey)
+    if monthlyStats is None:
+        monthlyStats = fillMonthStructure()
+
+        aggregateShard(monthlyStats, propertyID, engine, source, inputPath)
+
+        finishStats(monthlyStats, propertyID)
+        if cacheKey is not None:
+            contentCache.store("stats", cacheKey, monthlyStats)
+
+    writeStats(monthlyStats, propertyID, outputFormat)
+
+
+# parallel version of main for several properties at once
+# every property is aggregated in its own process by default
+# monthsPerShard also splits each property's months into shards of that many months, the shards are then put back
+# together per property, every shard reads the whole dataset so this only pays off with the warehouse as the source,
+# where each shard only queries its own months
+def mainParallel(properties=propertyIDs, engine="vectorized", source="dataset", workers=None, monthsPerShard=None, outputFormat="json", useCache=True):
+    # properties whose stats are cached are not sharded at all
+    cacheKeys = {propertyID: statsCacheKey(propertyID, engine, source) if useCache else None for propertyID in properties}
+    results = {}
+    for propertyID in properties:
+        monthlyStats = cachedStats(propertyID, cacheKeys[propertyID])
+        if monthlyStats is not None:
+            results[propertyID] = monthlyStats
+    computed = [propertyID for propertyID in properties if propertyID not in results]
+
+    allMonths = list(fillMonthStructure().keys())
+    shardMonths = [allMonths[i:i + monthsPerShard] for i in range(0, len(allMonths), monthsPerShard)] if monthsPerShard else [None]
+    shards = [(propertyID, months) for propertyID in computed for months in shardMonths]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(runShard, propertyID, months, engine, source) for propertyID, months in shards]
+        # every property starts empty and picks up its months from the shards that computed them
+        results.update({propertyID: fillMonthStructure() for propertyID in computed})
+        for (propertyID, months), future in zip(shards, futures):
+            shardStats, shardMetrics = future.result()
+            mergeStats(results[propertyID], shardStats)
+            metrics.merge(shardMetrics)
+
+    for propertyID in computed:
+        finishStats(results[propertyID], propertyID)
+        if cacheKeys[propertyID] is not None:
+            contentCache.store("stats", cacheKeys[propertyID], results[propertyID])
+
+    for propertyID in properties:
+        writeStats(results[propertyID], propertyID, outputFormat)
+
+
+# the cache key of a property's finished stats
+# it covers the contents of the reservations read, the search window, the engine and the code in statsModules
+# returns None when there is no input to hash, the run then fails or computes as it would without the cache
+def statsCacheKey(propertyID, engine, source, inputPath=None):
+    if source == "warehouse":
+        # the warehouse is in wal mode, recent writes are only in the -wal file
+        inputDigests = [contentCache.fileDigest(warehouse.warehousePath), contentCache.fileDigest(f"{warehouse.warehousePath}-wal")]
+    else:
+        inputDigests = [contentCache.fileDigest(inputPath or reservationsPath(propertyID))]
+    if inputDigests[0] is None:
+        return None
+    windowStart, windowEnd = getSearchWindow()
+    return contentCache.makeKey([
+        "monthlyStats", propertyID, engine, source, inputDigests,
+        totalStartDate.isoformat(), numMonthsLookAhead, windowStart.isoformat(), windowEnd.isoformat(),
+        contentCache.codeVersion(statsModules),
+    ])
+
+
+# the finished stats of an earlier run with the same key, or None
+def cachedStats(propertyID, cacheKey):
+    if cacheKey is None:
+        return None
+    with metrics.span("cache"):
+        monthlyStats = contentCache.load("stats", cacheKey)
+    if monthlyStats is not None:
+        metrics.count("cacheHits")
+        print(f"{propertyID}: nothing changed since the last run, using the cached stats")
+    return monthlyStats
+
+
+# runs in a worker process, aggregates the reservations of a property into only the given months, every month when None
+# the shard's own metrics go back with its stats, a worker that runs several shards starts each one from zero
+def runShard(propertyID, months, engine, source):
+    metrics.reset()
+    shardStats = fillMonthStructure(months)
+    aggregateShard(shardStats, propertyID, engine, source)
+    return (shardStats, metrics.snapshot())
+
+
+# add every reservation of a property into stats, only the months already in stats are counted
+def aggregateShard(stats, propertyID, engine, source, inputPath=None):
+    # where the reservation data is being stored (JSON lines), each property has its own file
+    reservationJSON = inputPath or reservationsPath(propertyID)
+
+    windowStart, windowEnd = getSearchWindow()
+    if source == "warehouse":
+        # only the reservations overlapping the months we are counting are read
+        monthStarts = [datetime.strptime(month, "%Y-%m").date() for month in stats]
+        queryStart = max(windowStart, min(monthStarts))
+        queryEnd = min(windowEnd, max(monthStarts) + relativedelta(months=1))
+        conn = warehouse.connect()
+        with metrics.span("query"):
+            reservations = list(warehouse.queryWindow(conn, propertyID, queryStart, queryEnd))
+        conn.close()
+        batches = [reservations]
+    else:
+        # readReservations treats a missing file as empty, here that would only write an empty stats file
+        if not os.path.exists(reservationJSON):
+            raise FileNotFoundError(f"{propertyID}: no reservations at {reservationJSON}, run gatherReservations.py first")
+        # reservations are streamed from the file in bounded batches so memory stays flat as the history grows
+        batches = readBatches(reservationJSON, batchSize)
+
+    batches = iter(batches)
+    while True:
+        # reading and decoding the next batch is timed apart from aggregating it
+        with metrics.span("parse"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        metrics.count("reservations", len(batch))
+        with metrics.span("aggregate"):
+            aggregateBatch(batch, stats, engine)
+
+
+# add one batch of reservations into stats with the chosen engine
+def aggregateBatch(batch, stats, engine):
+    if engine == "vectorized":
+        windowStart, windowEnd = getSearchWindow()
+        roomNightEngine.processData(batch, stats, windowStart, windowEnd, validStatus)
+    else:
+        processData(batch, stats)
+
+
+# add the additive stats of one set of months into another, months missing from target are added
+def mergeStats(target, source):
+    for month, stats in source.items():
+        if month not in target:
+            target[month] = dict(stats)
+            continue
+        for stat in additiveStats:
+            target[month][stat] += stats[stat]
+
+
+# work out the derived stats and drop the padding months
+def finishStats(monthlyStats, propertyID):
     # this function calcultes overall statistics for the reservations
-    calculateTotalStats()
+    with metrics.span("totals"):
+        calculateTotalStats(monthlyStats, propertyID)
 
     # remove any entries that are blank, this is used to remove the padding months
     # padding months are the extra month before and after the period of reservations that is being serarched, this was added to account for reservations going into and leaving the period we are seatching
@@ -58,14 +212,29 @@ def main():
         if monthlyStats[month]["occupancyPercent"] == 0:
             del monthlyStats[month]
 
-    # write data to output
-    with open(outputJSON,"w", encoding="utf-8") as f:
-        json.dump(monthlyStats,fp=f, indent=4)
 
+# write the property's stats file
+def writeStats(monthlyStats, propertyID, outputFormat="json"):
+    # format the start date
+    today = totalStartDate.strftime("%m-%d-%Y")
+    
+    # create output json name based on todays date and the property
+    outputName = f"{today}_{numMonthsLookAhead}_months_{propertyID}"
+    outputJSON = f"../data/{outputName}.{statsExtensions[outputFormat]}"
 
-def processData(data):
-    dateFormat = "%Y-%m-%d"
-    fullDateFormat = "%Y-%m-%d %H:%M:%S"
+    # write data to output
+    with metrics.span("writeStats"):
+        serialization.dump(monthlyStats, outputJSON, outputFormat, pretty=True)
+
+
+# monthlyStats only needs to hold the months being counted, anything outside them is skipped
+# dates are day ordinals and every night's month and rate key comes out of the calendar, nothing is formatted per night
+def processData(data, monthlyStats):
+    calendar = calendarDimension.getCalendar()
+    windowStart, windowEnd = getSearchWindow()
+    windowStart = windowStart.toordinal()
+    windowEnd = windowEnd.toordinal()
+    nightsCounted = 0
     for row in data:
         rooms = row["rooms"]
         # for each room reserved in the reservation
@@ -75,13 +244,16 @@ def processData(data):
             startDate = room["roomCheckIn"]
             endDate = room["roomCheckOut"]
 
-            # format dates
-            startDateObject =  datetime.strptime(startDate, dateFormat).date()
-            endDateObject =  datetime.strptime(endDate, dateFormat).date()
-            yearMonth = startDateObject.strftime("%Y-%m")
-            
-            # if the reservation is not in the period we are searching, skip it
-            if(not isDateValid(startDateObject,endDateObject)): continue
+            # parse dates
+            checkIn = dayOrdinal(startDate)
+            checkOut = dayOrdinal(endDate)
+
+            # if the reservation is not in the period we are searching, skip it, same check as isDateValid
+            if checkIn >= windowEnd or checkOut <= windowStart: continue
+            # a stay running past either end of the calendar grows it, never in practice but an index must not wrap
+            if checkIn < calendar.firstDay or checkOut > calendar.lastDay:
+                calendar = calendarDimension.getCalendar(checkIn, checkOut)
+            yearMonth = calendar.monthKey(checkIn)
             
             # if the reseration is cancelled count it and skip it
             if(status not in validStatus):
@@ -90,46 +262,35 @@ def processData(data):
                 continue
             # calulate the number of nights
             # this is done by walking the dates day by day, determining which month we are currently in and split reservations that way
-            current_date = startDateObject
-            # while reseravtion is not over
-            while current_date < endDateObject:
-                yearMonth = current_date.strftime("%Y-%m")
+            for night in range(checkIn, checkOut):
+                yearMonth = calendar.monthKey(night)
                 # if somehow the year/month we are in is not in our searching period, skip it
                 # this is just an extra safety check
                 if yearMonth not in monthlyStats: continue
-                
-                # format the current date
-                currDate = current_date.strftime(dateFormat)
 
                 # increment stats
                 monthlyStats[yearMonth]["nightsRented"] += 1
-                totalRevenue = room["detailedRoomRates"][currDate]
+                nightsCounted += 1
+                totalRevenue = room["detailedRoomRates"][calendar.dayKey(night)]
                 monthlyStats[yearMonth]["totalRevenue"] += totalRevenue
-                current_date += relativedelta(days=1)
+            # the reservation is counted in the month of its last night, skip it if that month is not being counted
+            if yearMonth not in monthlyStats: continue
             monthlyStats[yearMonth]["numReservations"] += 1
 
-            dateBooked = datetime.strptime(row["dateCreated"], fullDateFormat).date()
-            leadTime = (startDateObject - dateBooked).days
+            # only the date part of dateCreated matters for lead time
+            leadTime = checkIn - dayOrdinal(row["dateCreated"][:10])
             monthlyStats[yearMonth]["totalBookingLeadTime"] += leadTime
+    metrics.count("roomNights", nightsCounted)
 
 
 
 
 
-def calculatePossibleNights(month):
-    # we currently have 48 units, this will need to be adjusted if any are added or removed
-    numUnits = 48
-
-    # how many days are in the current month?
-    daysInMonth = monthrange(month.year, month.month)
-
-    # grab the number of days we have in the months and multiply by the number of units we have
-    possibleNights = daysInMonth[1] * numUnits
-    return possibleNights
-
 # this is used to fill the inital JSON structure
-def fillMonthStructure():
+# returns a new stats dict, onlyMonths limits it to some of the months (used by the parallel shards)
+def fillMonthStructure(onlyMonths=None):
     format = "%Y-%m"
+    monthlyStats = {}
 
     # go one in the past to add a padding month, this is for reservations that check in before the period but checkout in the period
     todayOneMonthInPast = totalStartDate - relativedelta(months=1)
@@ -137,6 +298,7 @@ def fillMonthStructure():
     for i in range(numMonthsLookAhead + 2):
         monthToAdd = todayOneMonthInPast + relativedelta(months=i)
         monthFormatted = monthToAdd.strftime(format)
+        if onlyMonths is not None and monthFormatted not in onlyMonths: continue
         monthDataPoints = {
             "occupancyPercent": 0,
             "nightsRented": 0,
@@ -155,15 +317,11 @@ def fillMonthStructure():
             "revPAR" : 0,
         }
         monthlyStats[monthFormatted] = monthDataPoints
+    return monthlyStats
 
 # returns true if valid date and false otherwise
 def isDateValid(checkInDate, checkOutDate):
-    today = totalStartDate
-    startOfThisMonth = date(today.year, today.month, 1)
-    # grab the first day of the next month
-    firstDayOfNextMonth = startOfThisMonth + relativedelta(months = numMonthsLookAhead)
-    # subtract 1 to get the apropraite last day of month
-    lastDayOfMonth = firstDayOfNextMonth - relativedelta(days=1)
+    startOfThisMonth, lastDayOfMonth = getSearchWindow()
 
     # check if the check out is in the past or in the future
     isCheckInInFuture = checkInDate >= lastDayOfMonth
@@ -171,8 +329,20 @@ def isDateValid(checkInDate, checkOutDate):
     return not(isCheckInInFuture or isCheckOutInPast)
             
 
+# returns (first day, last day) of the period we are searching
+# today is totalStartDate unless given, a process that runs for longer than a day passes the current date
+def getSearchWindow(today=None):
+    today = today or totalStartDate
+    startOfThisMonth = date(today.year, today.month, 1)
+    # grab the first day of the next month, the look ahead is worked out the same way as numMonthsLookAhead
+    firstDayOfNextMonth = startOfThisMonth + relativedelta(months = 11 - today.month)
+    # subtract 1 to get the apropraite last day of month
+    lastDayOfMonth = firstDayOfNextMonth - relativedelta(days=1)
+    return (startOfThisMonth, lastDayOfMonth)
+            
+
 # this is used to geenrate overall stats for the reservations
-def calculateTotalStats():
+def calculateTotalStats(monthlyStats, propertyID):
     today = totalStartDate
     format = "%Y-%m"
     # for each month
@@ -181,28 +351,32 @@ def calculateTotalStats():
         monthToCalculate = today + relativedelta(months=i)
         monthFormatted = monthToCalculate.strftime(format)
         
-        # how many possible nights do we have in this month
-        possibleNights = calculatePossibleNights(monthToCalculate)
-
-        # grab needed metrics for the stats
-        nightsOccupied = monthlyStats[monthFormatted]["nightsRented"]
-        numResevations = monthlyStats[monthFormatted]["numReservations"]
-        totalBookingLeadTime = monthlyStats[monthFormatted]["totalBookingLeadTime"]
-        totalCancelations = monthlyStats[monthFormatted]["cancelledReservations"]
-        totalRevenue = monthlyStats[monthFormatted]["totalRevenue"]
-
-        # calculate key metrics
-        occupancyRate = float(f"{((nightsOccupied / possibleNights) * 100):.2f}")
-        monthlyStats[monthFormatted]["occupancyPercent"] = occupancyRate
-        monthlyStats[monthFormatted]["avgLengthOfStay"] = float(f"{nightsOccupied / numResevations:.2f}")
-        monthlyStats[monthFormatted]["totalRevenue"] = float(f"{monthlyStats[monthFormatted]["totalRevenue"]:.2f}")
-        monthlyStats[monthFormatted]["possibleNights"] = possibleNights
-        monthlyStats[monthFormatted]["avgRevenue"] = float(f"{totalRevenue / numResevations:.2f}")
-        monthlyStats[monthFormatted]["bookingLeadTime"] = float(f"{totalBookingLeadTime / numResevations:.2f}")
-        monthlyStats[monthFormatted]["avgDailyRate"] = float(f"{totalRevenue / nightsOccupied:.2f}")
-        monthlyStats[monthFormatted]["revPAR"] = float(f"{totalRevenue / possibleNights:.2f}")
-        monthlyStats[monthFormatted]["possibleRevenue"] = float(f"{possibleNights * monthlyStats[monthFormatted]["avgDailyRate"]:.2f}")
-        monthlyStats[monthFormatted]["cancelationRate"] = float(f"{totalCancelations / (totalCancelations + numResevations) * 100:.2f}")
+        # how many possible nights do we have in this month, from the units the property had each day
+        possibleNights = calendarDimension.possibleNights(propertyID, monthFormatted)
+
+        # ratios are worked out the same way the persisted aggregates do it
+        calculateMonthMetrics(monthlyStats[monthFormatted], possibleNights)
 
 if(__name__ == "__main__"):
-    main()
+    parser = argparse.ArgumentParser(description="Calculate monthly stats from the reservations")
+    parser.add_argument("--property", action="append", dest="properties", help="property to calculate the stats for, can be given more than once, the first one in config by default")
+    parser.add_argument("--engine", choices=["vectorized", "loop"], default="vectorized", help="how the reservations are aggregated")
+    parser.add_argument("--source", choices=["dataset", "warehouse"], default="dataset", help="where the reservations are read from")
+    parser.add_argument("--input", help="read this reservation file instead of the property's dataset (json lines, a json array or a snapshot)")
+    parser.add_argument("--format", choices=list(statsExtensions), default="json", help="write the stats as indented json or as a compressed snapshot")
+    parser.add_argument("--parallel", action="store_true", help="calculate every property (or the --property ones) at once, one process per property")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes for --parallel, defaults to one per core")
+    parser.add_argument("--months-per-shard", type=int, default=None, help="also split every property into shards of this many months, only worth it with --source warehouse")
+    parser.add_argument("--no-cache", action="store_true", help="always recalculate, even when the reservations and code are unchanged since the last run")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    # --input is one property's file, it cannot be shared between several properties or processes
+    if args.input and (args.parallel or len(args.properties or []) > 1):
+        parser.error("--input reads the reservations of a single property, it cannot be combined with --parallel or several --property")
+    metrics.configure(args)
+    if args.parallel:
+        mainParallel(properties=args.properties or propertyIDs, engine=args.engine, source=args.source, workers=args.workers, monthsPerShard=args.months_per_shard, outputFormat=args.format, useCache=not args.no_cache)
+    else:
+        for propertyID in args.properties or [propertyIDs[0]]:
+            main(propertyID=propertyID, engine=args.engine, source=args.source, inputPath=args.input, outputFormat=args.format, useCache=not args.no_cache)
+    metrics.finish("runStats", args)
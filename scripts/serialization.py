@@ -0,0 +1,200 @@
+import os
+import gzip
+import json
+import codecs
+import zlib
+
+import orjson
+
+# every script reads and writes its json through here
+# formats:
+#   "json"     one json document (orjson, minified unless pretty)
+#   "jsonl"    one json document per line, used for lists of records like the reservation datasets
+#   "snapshot" compressed binary: a header followed by zlib compressed json lines
+# the format of a file is detected when it is read, so the extension does not matter
+
+snapshotMagic = b"CBSNAP1"
+# the byte after the magic says whether the snapshot holds one object or a list of records
+snapshotObject = b"O"
+snapshotRecords = b"L"
+
+formats = ["json", "jsonl", "snapshot"]
+
+# how much of a file is read at a time when streaming
+readChunkSize = 1024 * 1024
+
+dumpOptions = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(obj, pretty=False):
+    return orjson.dumps(obj, option=dumpOptions | (orjson.OPT_INDENT_2 if pretty else 0))
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+# one record of a line delimited file, newline included
+def dumpLine(obj):
+    return orjson.dumps(obj, option=dumpOptions | orjson.OPT_APPEND_NEWLINE)
+
+
+# write obj to path, the file is replaced in one step so readers never see half of it
+def dump(obj, path, format="json", pretty=False):
+    tempPath = f"{path}.tmp"
+    with open(tempPath, "wb") as f:
+        if format == "json":
+            f.write(dumps(obj, pretty))
+        elif format == "jsonl":
+            for record in obj:
+                f.write(dumpLine(record))
+        elif format == "snapshot":
+            writeSnapshot(f, obj)
+        else:
+            raise ValueError(f"format must be one of {formats}")
+    os.replace(tempPath, path)
+
+
+# read a whole file, whatever format it is in
+# line delimited files and record snapshots come back as lists
+def load(path):
+    with open(path, "rb") as f:
+        head = f.read(len(snapshotMagic) + 1)
+    if head == snapshotMagic + snapshotObject:
+        with open(path, "rb") as f:
+            f.seek(len(head))
+            return loads(zlib.decompress(f.read()))
+    if head.startswith(snapshotMagic) or isLineDelimited(path):
+        return list(iterRecords(path))
+    with openMaybeGzip(path) as f:
+        return loads(f.read())
+
+
+# stream the records of a list one at a time, for json arrays, line delimited files and record snapshots
+# nothing but the current record and one chunk of the file is held in memory
+def iterRecords(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        head = f.read(len(snapshotMagic) + 1)
+    if head == snapshotMagic + snapshotObject:
+        yield from load(path)
+        return
+    if head.startswith(snapshotMagic):
+        yield from iterSnapshotRecords(path)
+        return
+
+    with openMaybeGzip(path) as f:
+        # an array starts with [, a line delimited file starts with the first record
+        firstChar = f.read(1)
+        while firstChar.isspace():
+            firstChar = f.read(1)
+        if firstChar == b"[":
+            yield from iterJsonArray(f)
+            return
+        firstLine = firstChar + f.readline()
+        if firstLine.strip():
+            yield loads(firstLine)
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+# a dict is stored as one object, anything else is taken as a list of records and stored line by line
+# so record snapshots can be streamed back without decompressing the whole file
+def writeSnapshot(f, obj):
+    compressor = zlib.compressobj(6)
+    if isinstance(obj, dict):
+        f.write(snapshotMagic + snapshotObject)
+        f.write(compressor.compress(dumps(obj)))
+    else:
+        f.write(snapshotMagic + snapshotRecords)
+        for record in obj:
+            f.write(compressor.compress(dumpLine(record)))
+    f.write(compressor.flush())
+
+
+def iterSnapshotRecords(path):
+    decompressor = zlib.decompressobj()
+    pending = b""
+    with open(path, "rb") as f:
+        f.seek(len(snapshotMagic) + 1)
+        while True:
+            chunk = f.read(readChunkSize)
+            data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield loads(line)
+            if not chunk:
+                break
+    if pending.strip():
+        yield loads(pending)
+
+
+# decode the elements of a json array one by one, the opening [ has already been read
+# orjson cannot decode part of a document, so the stdlib decoder is used for this one case
+def iterJsonArray(f):
+    decoder = json.JSONDecoder()
+    # a character can be split between two chunks, the incremental decoder holds its first bytes back until the rest arrives
+    textDecoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    endOfFile = False
+    while True:
+        # skip the separators between elements
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ","):
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        if position < len(buffer):
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+                yield element
+                continue
+            except json.JSONDecodeError:
+                # the element runs past the end of the buffer, read more below
+                if endOfFile:
+                    raise
+        elif endOfFile:
+            raise json.JSONDecodeError("array is not closed", buffer, position)
+        data = f.read(readChunkSize)
+        endOfFile = data == b""
+        chunk = textDecoder.decode(data, final=endOfFile)
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+# a file whose first line is a complete json object and that has more lines is line delimited
+# a single line file is read as one json document, use iterRecords when a list is expected
+def isLineDelimited(path):
+    with openMaybeGzip(path) as f:
+        firstLine = f.readline()
+        if not firstLine.lstrip().startswith(b"{"):
+            return False
+        try:
+            loads(firstLine)
+        except orjson.JSONDecodeError:
+            return False
+        return f.readline().strip() != b""
+
+
+# raw page archives are gzip compressed json lines
+def openMaybeGzip(path):
+    with open(path, "rb") as f:
+        isGzip = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if isGzip else open(path, "rb")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a data file between json, json lines and compressed snapshots")
+    parser.add_argument("input", help="file to read, its format is detected")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--format", choices=formats, default="snapshot")
+    parser.add_argument("--pretty", action="store_true", help="indent json output")
+    args = parser.parse_args()
+
+    dump(load(args.input), args.output, args.format, args.pretty)
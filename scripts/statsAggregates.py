@@ -0,0 +1,159 @@
+import os
+
+from config import propertyIDs, reservationsPath
+from reservationStore import readReservations, getHighWaterMark, syncStateFormat
+import serialization
+import metrics
+import calendarDimension
+from reservationModel import fromReservation, monthKey, monthSegments
+
+# where the persisted aggregates of every property are kept
+aggregatesDir = "../data/aggregates"
+
+# the stats that can simply be added up, everything else in monthlyStats is derived from these
+additiveStats = ["nightsRented", "totalRevenue", "numReservations", "totalBookingLeadTime", "cancelledReservations"]
+
+
+# fill in the derived metrics of a month from its additive stats
+# months without any nights or reservations get 0 instead of dividing by zero
+def calculateMonthMetrics(stats, possibleNights):
+    # grab needed metrics for the stats
+    nightsOccupied = stats["nightsRented"]
+    numResevations = stats["numReservations"]
+    totalBookingLeadTime = stats["totalBookingLeadTime"]
+    totalCancelations = stats["cancelledReservations"]
+    totalRevenue = stats["totalRevenue"]
+
+    # calculate key metrics
+    occupancyRate = float(f"{(safeDivide(nightsOccupied, possibleNights) * 100):.2f}")
+    stats["occupancyPercent"] = occupancyRate
+    stats["avgLengthOfStay"] = float(f"{safeDivide(nightsOccupied, numResevations):.2f}")
+    stats["totalRevenue"] = float(f"{stats["totalRevenue"]:.2f}")
+    stats["possibleNights"] = possibleNights
+    stats["avgRevenue"] = float(f"{safeDivide(totalRevenue, numResevations):.2f}")
+    stats["bookingLeadTime"] = float(f"{safeDivide(totalBookingLeadTime, numResevations):.2f}")
+    stats["avgDailyRate"] = float(f"{safeDivide(totalRevenue, nightsOccupied):.2f}")
+    stats["revPAR"] = float(f"{safeDivide(totalRevenue, possibleNights):.2f}")
+    stats["possibleRevenue"] = float(f"{possibleNights * stats["avgDailyRate"]:.2f}")
+    stats["cancelationRate"] = float(f"{safeDivide(totalCancelations, totalCancelations + numResevations) * 100:.2f}")
+    return stats
+
+
+def safeDivide(numerator, denominator):
+    if denominator == 0:
+        return 0
+    return numerator / denominator
+
+
+# what a single reservation adds to each month, using the same rules as runStats.processData
+# nights and revenue go to the month of each night, the reservation and its lead time go to the month of the last night
+# cancelled rooms count in the month they were supposed to check in
+# returns {"YYYY-MM": {stat: value}}
+def reservationContribution(reservation):
+    contribution = {}
+    if reservation is None:
+        return contribution
+    for stay in fromReservation(reservation):
+        if not stay.isValid:
+            monthStats(contribution, monthKey(stay.checkIn))["cancelledReservations"] += 1
+            continue
+
+        for yearMonth, fromDay, toDay in monthSegments(stay.checkIn, stay.checkOut):
+            stats = monthStats(contribution, yearMonth)
+            stats["nightsRented"] += toDay - fromDay
+            stats["totalRevenue"] += stay.revenue(fromDay, toDay)
+        stats = monthStats(contribution, monthKey(stay.lastNight))
+        stats["numReservations"] += 1
+        stats["totalBookingLeadTime"] += stay.leadTime
+    return contribution
+
+
+def monthStats(months, yearMonth):
+    if yearMonth not in months:
+        months[yearMonth] = {stat: 0 for stat in additiveStats}
+    return months[yearMonth]
+
+
+# the aggregates of a property are the additive stats of every month plus the derived monthlyStats
+# syncMark is the high-water mark of the dataset they were built from, a delta is only applied on top of
+# aggregates that saw every sync before it, anything else has to be rebuilt
+def emptyAggregates():
+    return {"syncMark": None, "partials": {}, "monthlyStats": {}}
+
+
+def aggregatesPath(propertyID):
+    return f"{aggregatesDir}/{propertyID}.json"
+
+
+def loadAggregates(propertyID):
+    path = aggregatesPath(propertyID)
+    if not os.path.exists(path):
+        return emptyAggregates()
+    return serialization.load(path)
+
+
+def saveAggregates(propertyID, aggregates):
+    os.makedirs(aggregatesDir, exist_ok=True)
+    serialization.dump(aggregates, aggregatesPath(propertyID))
+
+
+# apply a batch of changed reservations to the aggregates
+# changes are (old, new) pairs, old is None for a new reservation and new is None for a removed one
+# a cancellation is just a new copy with a different room status
+# returns the months whose stats changed
+def applyChanges(aggregates, changes, propertyID):
+    partials = aggregates["partials"]
+    affectedMonths = set()
+    for old, new in changes:
+        for sign, reservation in ((-1, old), (1, new)):
+            for yearMonth, stats in reservationContribution(reservation).items():
+                monthTotals = monthStats(partials, yearMonth)
+                for stat in additiveStats:
+                    monthTotals[stat] += sign * stats[stat]
+                affectedMonths.add(yearMonth)
+
+    # rates are in cents, rounding stops subtract and add from drifting over many batches
+    for yearMonth in affectedMonths:
+        partials[yearMonth]["totalRevenue"] = round(partials[yearMonth]["totalRevenue"], 2)
+
+    recalculateMonths(aggregates, affectedMonths, propertyID)
+    return affectedMonths
+
+
+# only the months that changed have their ratios worked out again
+# possible nights come from the property's units in the calendar, so they follow its inventory
+def recalculateMonths(aggregates, months, propertyID):
+    for yearMonth in months:
+        stats = dict(aggregates["partials"][yearMonth])
+        aggregates["monthlyStats"][yearMonth] = calculateMonthMetrics(stats, calendarDimension.possibleNights(propertyID, yearMonth))
+
+
+# whether a delta synced after the high-water mark can be applied to these aggregates
+def isCurrent(aggregates, highWaterMark):
+    return highWaterMark is not None and aggregates.get("syncMark") == highWaterMark.strftime(syncStateFormat)
+
+
+# build a property's aggregates from its whole dataset, used after a full download
+# syncMark is the high-water mark the dataset is at, the one in the sync state when not given
+def rebuildAggregates(propertyID, syncMark=None):
+    syncMark = syncMark or getHighWaterMark(propertyID)
+    aggregates = emptyAggregates()
+    aggregates["syncMark"] = syncMark.strftime(syncStateFormat) if syncMark else None
+    applyChanges(aggregates, ((None, reservation) for reservation in readReservations(reservationsPath(propertyID))), propertyID)
+    saveAggregates(propertyID, aggregates)
+    return aggregates
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the persisted monthly aggregates from the reservation datasets")
+    parser.add_argument("--property", action="append", dest="properties", help="only rebuild this property, can be given more than once")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+    for propertyID in args.properties or propertyIDs:
+        with metrics.span("aggregates"):
+            aggregates = rebuildAggregates(propertyID)
+        print(f"{propertyID}: {len(aggregates['partials'])} months aggregated")
+    metrics.finish("statsAggregates", args)
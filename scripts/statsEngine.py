@@ -0,0 +1,144 @@
+from bisect import bisect_right
+from datetime import date
+
+from config import propertyIDs, reservationsPath
+from reservationStore import readReservations
+from statsAggregates import additiveStats, calculateMonthMetrics
+from reservationModel import loadStays
+import serialization
+import metrics
+import calendarDimension
+from calendarDimension import granularities
+
+
+# static interval index over [start, end) intervals
+# intervals are sorted by start and laid out as an implicit balanced tree where every node
+# knows the furthest end in its subtree, so a query only walks branches that can overlap
+# overlapping(a, b) is O(log n + number of matches)
+class IntervalIndex:
+    def __init__(self, items, getStart, getEnd):
+        items = sorted(items, key=getStart)
+        self.items = items
+        self.starts = [getStart(item) for item in items]
+        self.ends = [getEnd(item) for item in items]
+        self.maxEnds = list(self.ends)
+        self.buildMaxEnds(0, len(items))
+
+    # the node of [lo, hi) is its middle element, its maxEnd covers the whole range
+    def buildMaxEnds(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        maxEnd = self.ends[mid]
+        for childMax in (self.buildMaxEnds(lo, mid), self.buildMaxEnds(mid + 1, hi)):
+            if childMax is not None and childMax > maxEnd:
+                maxEnd = childMax
+        self.maxEnds[mid] = maxEnd
+        return maxEnd
+
+    # every item whose interval overlaps [queryStart, queryEnd)
+    def overlapping(self, queryStart, queryEnd):
+        found = []
+        stack = [(0, len(self.items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # nothing under this node ends after the query starts
+            if self.maxEnds[mid] <= queryStart:
+                continue
+            stack.append((lo, mid))
+            # everything right of a node starting after the query ends starts after it too
+            if self.starts[mid] < queryEnd:
+                if self.ends[mid] > queryStart:
+                    found.append(self.items[mid])
+                stack.append((mid + 1, hi))
+        return found
+
+    def __len__(self):
+        return len(self.items)
+
+
+# a stay covers its nights, a stay without nights still covers its check in day
+# so it can be counted as a reservation or a cancellation
+def buildIndex(stays):
+    return IntervalIndex(stays, lambda stay: stay.checkIn, lambda stay: max(stay.checkOut, stay.checkIn + 1))
+
+
+# the periods of [startDate, endDate) as (key, first day, day after the last day), clipped to the window
+def buildPeriods(startDate, endDate, granularity):
+    return calendarDimension.getCalendar(startDate.toordinal(), endDate.toordinal()).periods(startDate.toordinal(), endDate.toordinal(), granularity)
+
+
+# monthlyStats style metrics for any window and granularity
+# endDate is exclusive, nights and revenue go to the period of each night, reservations and lead time
+# to the period of the last night and cancellations to the period of the check in, same as runStats
+# only the stays that overlap the window are looked at
+# possible nights are the property's units on each day of the period, from the calendar
+def computeStats(index, startDate, endDate, granularity="monthly", propertyID=propertyIDs[0]):
+    periods = buildPeriods(startDate, endDate, granularity)
+    periodStarts = [periodStart for _, periodStart, _ in periods]
+    windowStart = startDate.toordinal()
+    windowEnd = endDate.toordinal()
+    totals = [{stat: 0 for stat in additiveStats} for _ in periods]
+
+    def periodOf(day):
+        return bisect_right(periodStarts, day) - 1
+
+    for stay in index.overlapping(windowStart, windowEnd):
+        checkIn = stay.checkIn
+        if not stay.isValid:
+            if windowStart <= checkIn < windowEnd:
+                totals[periodOf(checkIn)]["cancelledReservations"] += 1
+            continue
+
+        # walk the periods the stay covers instead of its nights
+        nightsFrom = max(checkIn, windowStart)
+        nightsTo = min(stay.checkOut, windowEnd)
+        if nightsFrom < nightsTo:
+            for periodIndex in range(periodOf(nightsFrom), periodOf(nightsTo - 1) + 1):
+                _, periodStart, periodEnd = periods[periodIndex]
+                fromDay = max(nightsFrom, periodStart)
+                toDay = min(nightsTo, periodEnd)
+                stats = totals[periodIndex]
+                stats["nightsRented"] += toDay - fromDay
+                stats["totalRevenue"] += stay.revenue(fromDay, toDay)
+
+        lastNight = stay.lastNight
+        if windowStart <= lastNight < windowEnd:
+            stats = totals[periodOf(lastNight)]
+            stats["numReservations"] += 1
+            stats["totalBookingLeadTime"] += stay.leadTime
+
+    result = {}
+    for (key, periodStart, periodEnd), stats in zip(periods, totals):
+        possibleNights = calendarDimension.possibleNightsBetween(propertyID, periodStart, periodEnd)
+        result[key] = calculateMonthMetrics(stats, possibleNights)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Calculate stats for any date range and granularity")
+    parser.add_argument("--property", default=propertyIDs[0], help="property to calculate the stats for")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="first day of the range (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="day after the last day of the range (YYYY-MM-DD)")
+    parser.add_argument("--granularity", choices=granularities, default="monthly")
+    parser.add_argument("--output", help="write the stats to this json file instead of printing them")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+
+    with metrics.span("load"):
+        stays = loadStays(readReservations(reservationsPath(args.property)))
+    with metrics.span("index"):
+        index = buildIndex(stays)
+    with metrics.span("compute"):
+        stats = computeStats(index, args.start, args.end, args.granularity, args.property)
+    if args.output:
+        serialization.dump(stats, args.output, pretty=True)
+    else:
+        print(serialization.dumps(stats, pretty=True).decode("utf-8"))
+    metrics.finish("statsEngine", args)
@@ -0,0 +1,229 @@
+import os
+import time
+import threading
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import serialization
+import metrics
+import statsEngine
+import gatherReservations
+import runStats
+from calendarDimension import granularities
+from config import propertyIDs, reservationsPath
+from reservationStore import readReservations
+from reservationModel import loadStays
+
+# a resident stats service: every property's stays are loaded once and kept in memory in statsEngine's
+# interval index, an incremental sync runs on a schedule and only the properties the sync changed
+# are loaded again, in the background, while the old copy keeps answering
+# queries are answered over local http as json, the same metrics as monthlyStats for any window:
+#   /stats?property=214969&start=2025-01-01&end=2026-01-01&granularity=monthly
+#   /properties   what is loaded and when it was last synced
+#   /metrics      query, reload and sync timings of this process
+
+DEFAULT_PORT = 8765
+# minutes between incremental syncs
+SYNC_INTERVAL = float(os.environ.get("CLOUDBEDS_SYNC_INTERVAL", 15))
+# how many answers are kept per property, they are all dropped when the property is loaded again
+MAX_CACHED_QUERIES = 1024
+
+
+# everything loaded for one property, never changed once built, a reload swaps in a new one
+class PropertyState:
+    def __init__(self, propertyID):
+        self.propertyID = propertyID
+        path = reservationsPath(propertyID)
+        info = os.stat(path)
+        # size and mtime tell a reload whether the dataset changed at all
+        self.version = (info.st_size, info.st_mtime_ns)
+        with metrics.span("load"):
+            stays = loadStays(readReservations(path))
+        with metrics.span("index"):
+            self.index = statsEngine.buildIndex(stays)
+        self.loadedAt = datetime.now()
+        # (start, end, granularity) -> stats
+        self.answers = {}
+
+    def stats(self, startDate, endDate, granularity):
+        key = (startDate, endDate, granularity)
+        answer = self.answers.get(key)
+        if answer is None:
+            metrics.count("queryMisses")
+            with metrics.span("compute"):
+                answer = statsEngine.computeStats(self.index, startDate, endDate, granularity, self.propertyID)
+            if len(self.answers) >= MAX_CACHED_QUERIES:
+                self.answers.clear()
+            self.answers[key] = answer
+        return answer
+
+
+class StatsService:
+    def __init__(self, properties):
+        self.properties = list(properties)
+        self.states = {}
+        self.lastSync = None
+        self.lastSyncError = None
+        # {propertyID: error} of the properties whose last reload failed, they keep their old copy and are retried
+        self.reloadErrors = {}
+        # only one sync or reload runs at a time, queries never wait on it
+        self.reloadLock = threading.Lock()
+
+    # load every property whose dataset is new or changed since it was loaded
+    # onlyProperties limits the check to those, the ones a sync reported as changed, and the ones that failed before
+    def reload(self, onlyProperties=None):
+        with self.reloadLock:
+            for propertyID in self.properties:
+                if onlyProperties is not None and propertyID not in onlyProperties and propertyID not in self.reloadErrors:
+                    continue
+                path = reservationsPath(propertyID)
+                if not os.path.exists(path):
+                    continue
+                info = os.stat(path)
+                current = self.states.get(propertyID)
+                if current is not None and current.version == (info.st_size, info.st_mtime_ns) and propertyID not in self.reloadErrors:
+                    continue
+                try:
+                    with metrics.span("reload"):
+                        state = PropertyState(propertyID)
+                        # warm the window runStats reports on, it is what dashboards ask for most
+                        state.stats(*defaultWindow(), "monthly")
+                except Exception as error:
+                    # a dataset that is half written or has a bad reservation keeps the copy already loaded
+                    self.reloadErrors[propertyID] = str(error)
+                    print(f"{propertyID}: reload failed: {error}")
+                    continue
+                self.reloadErrors.pop(propertyID, None)
+                self.states[propertyID] = state
+                print(f"{propertyID}: {len(state.index)} stays loaded")
+
+    def sync(self):
+        # after a failed sync some properties may still have been merged, so every one of them is checked
+        changedProperties = None
+        try:
+            with metrics.span("sync"):
+                changedProperties = gatherReservations.syncAllProperties(self.properties, incremental=True)
+            self.lastSyncError = None
+        except Exception as error:
+            # the last good data keeps being served, the next sync tries again
+            self.lastSyncError = str(error)
+            print(f"sync failed: {error}")
+        self.lastSync = datetime.now()
+        self.reload(changedProperties)
+
+    # sync forever in a background thread, every interval minutes
+    # without syncing the datasets are only checked for changes made by another process (cron, a manual sync)
+    def startSchedule(self, interval, syncing=True):
+        def scheduleLoop():
+            while True:
+                # nothing may end this thread, the service would keep serving the same data without saying so
+                try:
+                    if syncing:
+                        self.sync()
+                    else:
+                        self.reload()
+                except Exception as error:
+                    print(f"scheduled run failed: {error}")
+                time.sleep(interval * 60)
+        threading.Thread(target=scheduleLoop, daemon=True).start()
+
+    def describe(self):
+        return {
+            "properties": {
+                propertyID: {
+                    "stays": len(state.index),
+                    "loadedAt": state.loadedAt.isoformat(timespec="seconds"),
+                    "cachedQueries": len(state.answers),
+                }
+                for propertyID, state in self.states.items()
+            },
+            "lastSync": self.lastSync.isoformat(timespec="seconds") if self.lastSync else None,
+            "lastSyncError": self.lastSyncError,
+            "reloadErrors": dict(self.reloadErrors),
+        }
+
+
+# the months runStats reports on as of today, with the end made exclusive
+def defaultWindow():
+    windowStart, windowEnd = runStats.getSearchWindow(date.today())
+    return (windowStart, windowEnd + timedelta(days=1))
+
+
+class StatsHandler(BaseHTTPRequestHandler):
+    # set by makeServer
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        route = url.path.rstrip("/")
+        if route == "/stats":
+            self.sendStats(params)
+        elif route == "/properties":
+            self.send(200, self.service.describe())
+        elif route == "/metrics":
+            self.send(200, metrics.snapshot())
+        else:
+            self.send(404, {"error": f"unknown path {url.path}"})
+
+    def sendStats(self, params):
+        with metrics.span("query"):
+            propertyID = params.get("property", self.service.properties[0])
+            state = self.service.states.get(propertyID)
+            if state is None:
+                self.send(404, {"error": f"property {propertyID} is not loaded"})
+                return
+            try:
+                startDate, endDate = defaultWindow()
+                if "start" in params:
+                    startDate = date.fromisoformat(params["start"])
+                if "end" in params:
+                    endDate = date.fromisoformat(params["end"])
+                granularity = params.get("granularity", "monthly")
+                if granularity not in granularities:
+                    raise ValueError(f"granularity must be one of {granularities}")
+                if endDate <= startDate:
+                    raise ValueError("end must be after start")
+                stats = state.stats(startDate, endDate, granularity)
+            except ValueError as error:
+                self.send(400, {"error": str(error)})
+                return
+            self.send(200, stats)
+
+    def send(self, status, body):
+        payload = serialization.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def makeServer(service, host="127.0.0.1", port=DEFAULT_PORT):
+    handler = type("Handler", (StatsHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Keep the reservations in memory, sync them on a schedule and serve stats over local http")
+    parser.add_argument("--property", action="append", dest="properties", help="only serve this property, can be given more than once")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, only this machine by default")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--interval", type=float, default=SYNC_INTERVAL, help="minutes between incremental syncs")
+    parser.add_argument("--no-sync", action="store_true", help="only serve the datasets already on disk, reloading them when they change")
+    args = parser.parse_args()
+
+    service = StatsService(args.properties or propertyIDs)
+    service.reload()
+    service.startSchedule(args.interval, syncing=not args.no_sync)
+    server = makeServer(service, args.host, args.port)
+    print(f"serving stats on http://{args.host}:{server.server_address[1]}/stats", flush=True)
+    server.serve_forever()
@@ -0,0 +1,139 @@
+import os
+import math
+import random
+import zlib
+from datetime import date, timedelta
+
+import serialization
+from statsAggregates import calculateMonthMetrics
+import calendarDimension
+
+# fake reservations shaped like getReservationsWithRateDetails, for benchmarks and the mock server
+# every reservation is built from its own seed, so any page of any property can be generated on its own
+# and the mock server hands out exactly what writeDataset writes
+
+# rooms per reservation and nights per room, picked uniformly
+roomChoices = [1, 1, 1, 2]
+nightChoices = [1, 1, 2, 2, 3, 3, 4, 5, 7, 14]
+statusChoices = ["checked_out"] * 6 + ["not_checked_in"] * 2 + ["in_house", "canceled", "no_show"]
+
+# room-nights a reservation has on average, used to turn a room-night target into a reservation count
+meanNightsPerReservation = (sum(roomChoices) / len(roomChoices)) * (sum(nightChoices) / len(nightChoices))
+
+# stays are spread over last year, this year and next year so any stats window has data
+today = date.today()
+defaultStartDate = date(today.year - 1, 1, 1)
+defaultEndDate = date(today.year + 1, 12, 31)
+
+
+def syntheticPropertyIDs(numProperties):
+    return [f"synthetic{i + 1}" for i in range(numProperties)]
+
+
+# how many reservations each property needs for about roomNights room-nights across all of them
+def reservationsPerProperty(roomNights, numProperties):
+    return math.ceil(roomNights / meanNightsPerReservation / numProperties)
+
+
+def makeReservation(propertyID, index, seed=0, startDate=defaultStartDate, endDate=defaultEndDate):
+    rng = random.Random(seed * 1000003 + zlib.crc32(propertyID.encode("utf-8")) * 1000000007 + index)
+    spanDays = (endDate - startDate).days
+    rooms = []
+    firstCheckIn = None
+    for roomNumber in range(rng.choice(roomChoices)):
+        checkIn = startDate + timedelta(days=rng.randrange(spanDays))
+        nights = rng.choice(nightChoices)
+        if firstCheckIn is None or checkIn < firstCheckIn:
+            firstCheckIn = checkIn
+        baseRate = rng.uniform(80, 300)
+        rooms.append({
+            "roomID": f"{rng.randrange(1, 49)}-{roomNumber}",
+            "roomTypeID": str(rng.randrange(1, 6)),
+            "roomTypeName": "Synthetic Suite",
+            "roomStatus": rng.choice(statusChoices),
+            "roomCheckIn": checkIn.isoformat(),
+            "roomCheckOut": (checkIn + timedelta(days=nights)).isoformat(),
+            "detailedRoomRates": {
+                (checkIn + timedelta(days=night)).isoformat(): round(baseRate * rng.uniform(0.9, 1.1), 2)
+                for night in range(nights)
+            },
+            "adults": str(rng.randrange(1, 4)),
+            "children": "0",
+        })
+    dateCreated = firstCheckIn - timedelta(days=rng.randrange(180), seconds=rng.randrange(86400))
+    dateModified = dateCreated + timedelta(days=rng.randrange(30))
+    # the fields the pipeline drops are there too, so projection and parsing costs are realistic
+    return {
+        "reservationID": f"{propertyID}-{index}",
+        "status": "confirmed",
+        "dateCreated": dateCreated.strftime("%Y-%m-%d %H:%M:%S"),
+        "dateModified": dateModified.strftime("%Y-%m-%d %H:%M:%S"),
+        "guestName": f"Guest {index}",
+        "guestEmail": f"guest{index}@example.com",
+        "sourceName": rng.choice(["Website", "Booking.com", "Expedia", "Walk-In"]),
+        "total": round(sum(sum(room["detailedRoomRates"].values()) for room in rooms), 2),
+        "balance": 0,
+        "rooms": rooms,
+    }
+
+
+# reservations [first, last) of a property, one page of the mock server is one such range
+def generateReservations(propertyID, first, last, seed=0):
+    for index in range(first, last):
+        yield makeReservation(propertyID, index, seed)
+
+
+# write one line delimited dataset per property into directory
+# roomNights is only a target, returns ({propertyID: path}, room-nights actually written)
+def writeDataset(directory, roomNights, numProperties=1, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    count = reservationsPerProperty(roomNights, numProperties)
+    paths = {}
+    written = 0
+
+    def tagged(reservations, propertyID):
+        nonlocal written
+        for reservation in reservations:
+            written += sum(len(room["detailedRoomRates"]) for room in reservation["rooms"])
+            yield dict(reservation, propertyID=propertyID)
+
+    for propertyID in syntheticPropertyIDs(numProperties):
+        paths[propertyID] = f"{directory}/{propertyID}.jsonl"
+        serialization.dump(tagged(generateReservations(propertyID, 0, count, seed), propertyID), paths[propertyID], "jsonl")
+    return (paths, written)
+
+
+# a monthlyStats dict covering every month of years, for timing the graphs without running the stats first
+def generateMonthlyStats(years, seed=0):
+    rng = random.Random(seed)
+    monthlyStats = {}
+    for year in years:
+        for month in range(1, 13):
+            monthStart = date(year, month, 1)
+            possibleNights = calendarDimension.possibleNights(syntheticPropertyIDs(1)[0], monthStart.strftime("%Y-%m"))
+            nightsRented = rng.randrange(possibleNights // 3, possibleNights)
+            numReservations = max(nightsRented // 4, 1)
+            stats = {
+                "nightsRented": nightsRented,
+                "numReservations": numReservations,
+                "cancelledReservations": rng.randrange(numReservations // 5 + 1),
+                "totalRevenue": nightsRented * rng.uniform(120, 220),
+                "totalBookingLeadTime": numReservations * rng.randrange(10, 60),
+            }
+            monthlyStats[monthStart.strftime("%Y-%m")] = calculateMonthMetrics(stats, possibleNights)
+    return monthlyStats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic reservation datasets shaped like the Cloudbeds api")
+    parser.add_argument("--room-nights", type=int, default=100000, help="about how many room-nights to generate across every property")
+    parser.add_argument("--properties", type=int, default=1, help="number of properties to spread them over")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="../data/synthetic", help="directory the datasets are written to")
+    args = parser.parse_args()
+    paths, written = writeDataset(args.output, args.room_nights, args.properties, args.seed)
+    for propertyID, path in paths.items():
+        print(f"{propertyID}: {path}")
+    print(f"{written} room-nights written")
@@ -0,0 +1,167 @@
+import sqlite3
+from itertools import groupby
+
+from config import reservationsPath
+from reservationStore import readReservations
+import metrics
+
+# local sqlite copy of every property's reservations
+warehousePath = "../data/reservations.db"
+
+# reservations, the rooms booked in them and the rate of every night of every room
+# room nights keep their own dates so month and property questions never have to expand stays
+schema = """
+CREATE TABLE IF NOT EXISTS reservations (
+    reservationID TEXT PRIMARY KEY,
+    propertyID TEXT NOT NULL,
+    status TEXT,
+    dateCreated TEXT,
+    dateModified TEXT
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    roomRowID INTEGER PRIMARY KEY,
+    reservationID TEXT NOT NULL REFERENCES reservations(reservationID) ON DELETE CASCADE,
+    propertyID TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    roomStatus TEXT,
+    roomCheckIn TEXT,
+    roomCheckOut TEXT,
+    roomTypeID TEXT,
+    roomID TEXT
+);
+CREATE TABLE IF NOT EXISTS roomNights (
+    roomRowID INTEGER NOT NULL REFERENCES rooms(roomRowID) ON DELETE CASCADE,
+    propertyID TEXT NOT NULL,
+    night TEXT NOT NULL,
+    rate REAL,
+    PRIMARY KEY (roomRowID, night)
+);
+CREATE INDEX IF NOT EXISTS idxReservationsProperty ON reservations(propertyID);
+CREATE INDEX IF NOT EXISTS idxReservationsDateCreated ON reservations(dateCreated);
+CREATE INDEX IF NOT EXISTS idxRoomsReservation ON rooms(reservationID);
+CREATE INDEX IF NOT EXISTS idxRoomsCheckIn ON rooms(propertyID, roomCheckIn);
+CREATE INDEX IF NOT EXISTS idxRoomsCheckOut ON rooms(propertyID, roomCheckOut);
+CREATE INDEX IF NOT EXISTS idxRoomsStatus ON rooms(propertyID, roomStatus);
+CREATE INDEX IF NOT EXISTS idxRoomNightsNight ON roomNights(propertyID, night);
+"""
+
+
+# every property thread opens its own connection, the timeout lets them wait for each others writes
+def connect(path=warehousePath):
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(schema)
+    return conn
+
+
+# load a property's dataset into the warehouse
+# reservations that are already there are replaced, so this works for full and incremental syncs
+# replaceAll drops everything the property had first, used after a full download
+def loadProperty(conn, propertyID, path=None, replaceAll=False):
+    path = path or reservationsPath(propertyID)
+    count = 0
+    with conn:
+        if replaceAll:
+            conn.execute("DELETE FROM reservations WHERE propertyID = ?", (propertyID,))
+        for reservation in readReservations(path):
+            upsertReservation(conn, reservation, propertyID)
+            count += 1
+    return count
+
+
+# whether a property was ever loaded, a delta only makes sense on top of a full load
+def hasProperty(conn, propertyID):
+    return conn.execute("SELECT 1 FROM reservations WHERE propertyID = ? LIMIT 1", (propertyID,)).fetchone() is not None
+
+
+def upsertReservation(conn, reservation, propertyID):
+    reservationID = reservation["reservationID"]
+    # an updated reservation keeps its row so it stays in the same order as in the dataset
+    conn.execute(
+        """
+        INSERT INTO reservations (reservationID, propertyID, status, dateCreated, dateModified) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(reservationID) DO UPDATE SET
+            propertyID = excluded.propertyID,
+            status = excluded.status,
+            dateCreated = excluded.dateCreated,
+            dateModified = excluded.dateModified
+        """,
+        (reservationID, propertyID, reservation.get("status"), reservation.get("dateCreated"), reservation.get("dateModified"))
+    )
+    # deleting cascades to the nights of the old rooms
+    conn.execute("DELETE FROM rooms WHERE reservationID = ?", (reservationID,))
+    for position, room in enumerate(reservation.get("rooms", [])):
+        cursor = conn.execute(
+            "INSERT INTO rooms (reservationID, propertyID, position, roomStatus, roomCheckIn, roomCheckOut, roomTypeID, roomID) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (reservationID, propertyID, position, room.get("roomStatus"), room.get("roomCheckIn"), room.get("roomCheckOut"), room.get("roomTypeID"), room.get("roomID"))
+        )
+        roomRowID = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO roomNights (roomRowID, propertyID, night, rate) VALUES (?, ?, ?, ?)",
+            [(roomRowID, propertyID, night, rate) for night, rate in (room.get("detailedRoomRates") or {}).items()]
+        )
+
+
+# yields the reservations of a property that have a room overlapping [windowStart, windowEnd]
+# they come back in the same shape as the api returns them so processData can use them as is
+# the indexes on check in and check out mean only matching reservations are ever read
+def queryWindow(conn, propertyID, windowStart, windowEnd):
+    rows = conn.execute(
+        """
+        SELECT r.reservationID, r.dateCreated, rm.roomRowID, rm.roomStatus, rm.roomCheckIn, rm.roomCheckOut, n.night, n.rate
+        FROM reservations r
+        JOIN rooms rm ON rm.reservationID = r.reservationID
+        LEFT JOIN roomNights n ON n.roomRowID = rm.roomRowID
+        WHERE r.reservationID IN (
+            SELECT reservationID FROM rooms
+            WHERE propertyID = ? AND roomCheckIn <= ? AND roomCheckOut >= ?
+        )
+        ORDER BY r.rowid, rm.position, n.night
+        """,
+        (propertyID, windowEnd.isoformat(), windowStart.isoformat())
+    )
+    # rows are one per night, group them back into reservations and rooms
+    for (reservationID, dateCreated), reservationRows in groupby(rows, key=lambda row: (row[0], row[1])):
+        rooms = []
+        for roomRowID, roomRows in groupby(reservationRows, key=lambda row: row[2]):
+            roomRows = list(roomRows)
+            _, _, _, roomStatus, roomCheckIn, roomCheckOut, _, _ = roomRows[0]
+            rooms.append({
+                "roomStatus": roomStatus,
+                "roomCheckIn": roomCheckIn,
+                "roomCheckOut": roomCheckOut,
+                # a room without nights comes back as a single row with no night
+                "detailedRoomRates": {row[6]: row[7] for row in roomRows if row[6] is not None},
+            })
+        yield {
+            "reservationID": reservationID,
+            "propertyID": propertyID,
+            "dateCreated": dateCreated,
+            "rooms": rooms,
+        }
+
+
+# run any read only sql against the warehouse, handy for one off questions
+# e.g. nights and revenue of a property for a month:
+#   query(conn, "SELECT COUNT(*), SUM(rate) FROM roomNights WHERE propertyID = ? AND night >= ? AND night < ?", ("214969", "2025-03-01", "2025-04-01"))
+def query(conn, sql, params=()):
+    return conn.execute(sql, params).fetchall()
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import propertyIDs
+
+    parser = argparse.ArgumentParser(description="Load the reservation datasets into the sqlite warehouse")
+    parser.add_argument("--property", action="append", dest="properties", help="only load this property, can be given more than once")
+    metrics.addArguments(parser)
+    args = parser.parse_args()
+    metrics.configure(args)
+    conn = connect()
+    for propertyID in args.properties or propertyIDs:
+        with metrics.span("warehouse"):
+            count = loadProperty(conn, propertyID)
+        print(f"{propertyID}: {count} reservations loaded")
+    conn.close()
+    metrics.finish("warehouse", args)